@@ -1,31 +1,66 @@
 import sys
+from spotivol_startup import STARTUP
+
+# Must happen before the imports below so --profile-startup can time them
+STARTUP.install_if_requested(sys.argv)
+
+import os
+import gc
+import ctypes
 import threading
-import requests
 import traceback
 import webbrowser
-import json
-import os
-from urllib.parse import urlencode
-from http.server import HTTPServer, BaseHTTPRequestHandler
 
-from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton, QSlider,
-                             QVBoxLayout, QHBoxLayout, QComboBox, QTabWidget, QGroupBox, QMessageBox, QDialog)
-from PyQt5.QtCore import Qt, QEvent, pyqtSignal, QObject
+from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton, QSlider, QDoubleSpinBox,
+                             QSpinBox, QVBoxLayout, QHBoxLayout, QComboBox, QTabWidget, QGroupBox, QMessageBox,
+                             QDialog, QTableWidget, QTableWidgetItem, QHeaderView, QInputDialog, QSystemTrayIcon,
+                             QMenu)
+from PyQt5.QtGui import QIcon, QValidator
+from PyQt5.QtCore import Qt, QEvent, QTimer, pyqtSignal, QObject
+
+from spotivol_core import (MODE_API, MODE_HEDGED, MODE_BACKENDS, FADE_CURVES, LATENCY_PERCENTILES,
+                           SpotifyAuth, VolumeController, ProfileStore, HotkeyTable, StatusAggregator, TraceRecorder,
+                           LOCAL_MODE_BACKENDS, local_backend, local_mode, platform_mode, local_mode_available,
+                           valid_account_name, optional_import)
+from spotivol_control import ControlServer
+from spotivol_metrics import MetricsServer
+
+STARTUP.mark("imports")
 
 """
 importing sys lets us use the runtime environment of Python.
+importing os is for finding the tray icon next to this file.
+importing gc and ctypes lets tray mode hand the memory of the destroyed widgets back to the OS.
 importing threading lets us use multiple threads.
-importing requests lets us make HTTP requests for API usage.
 importing traceback is for error debugging.
 importing webbrowser opens URL in your default browser.
-importing json helps us on read/write structured data that is on json format.
-importing os lets us interact with operating system to check files existance.
-urllib.parse and http.server parts lets us create local server. For this app it helps us to get Spotify credentials.
 PyQt5 and things I import from there are essential for the GUI I am creating. They let me use the buttons and create all
 the design of the GUI.
+spotivol_startup times the startup when the app is run with --profile-startup.
+spotivol_core has everything that isn't GUI (auth, API client, backends), so headless mode can use it without PyQt5.
+spotivol_control is the local socket scripts can use to trigger profiles without faking key presses.
+spotivol_metrics serves the latency numbers over HTTP when "metrics_port" is set.
 """
 
 
+# Tray mode frees memory this long after the window is hidden, once Qt has deleted the widgets
+TRAY_RELEASE_DELAY_MS = 1000
+
+
+def release_freed_memory():
+    #Freed memory normally stays with the process for reuse. Hand it back so the resident size actually drops:
+    #trim the working set on Windows, trim malloc's free lists on Linux.
+    gc.collect()
+    try:
+        if sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetProcessWorkingSetSize(kernel32.GetCurrentProcess(), ctypes.c_size_t(-1), ctypes.c_size_t(-1))
+        elif sys.platform.startswith("linux"):
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
 class SettingsDialog(QDialog):
     """Dialog for entering Spotify API credentials"""
 
@@ -80,180 +115,51 @@ class SettingsDialog(QDialog):
         return self.client_id_input.text().strip(), self.client_secret_input.text().strip()
 
 
-# Spotify OAuth Configuration
-REDIRECT_URI = "http://127.0.0.1:8888/callback"
-SCOPE = "user-modify-playback-state user-read-playback-state"
-TOKEN_FILE = "spotify_tokens.json"
-SETTINGS_FILE = "spotify_settings.json"
-#Part above is essential for Spotify API usage. That's how we use the things we gain from API.
+class AuthSignals(QObject):
+    """Signals for OAuth callbacks"""
+    auth_complete = pyqtSignal(bool, str)
 
-class SpotifyAuth:
-    """Handles Spotify OAuth authentication and token management"""
 
-    def __init__(self):
-        self.access_token = None
-        self.refresh_token = None
-        self.client_id = None
-        self.client_secret = None
-        self.load_settings()
-        self.load_tokens()
-
-    def load_settings(self):
-        """This part loads Client ID and Secret from file"""
-        if os.path.exists(SETTINGS_FILE):
-            try:
-                with open(SETTINGS_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.client_id = data.get('client_id')
-                    self.client_secret = data.get('client_secret')
-            except Exception as e:
-                print(f"Failed to load settings: {e}")
-
-    def save_settings(self):
-        """Save Client ID and Secret to file"""
-        try:
-            with open(SETTINGS_FILE, 'w') as f:
-                json.dump({
-                    'client_id': self.client_id,
-                    'client_secret': self.client_secret
-                }, f)
-        except Exception as e:
-            print(f"Failed to save settings: {e}")
-
-    def load_tokens(self):
-        """Load saved tokens from file"""
-        if os.path.exists(TOKEN_FILE):
-            try:
-                with open(TOKEN_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.access_token = data.get('access_token')
-                    self.refresh_token = data.get('refresh_token')
-            except Exception as e:
-                print(f"Failed to load tokens: {e}")
-
-    def save_tokens(self):
-        """Save tokens to file"""
-        try:
-            with open(TOKEN_FILE, 'w') as f:
-                json.dump({
-                    'access_token': self.access_token,
-                    'refresh_token': self.refresh_token
-                }, f)
-        except Exception as e:
-            print(f"Failed to save tokens: {e}")
-
-    def get_auth_url(self):
-        """Generate Spotify authorization URL"""
-        params = {
-            'client_id': self.client_id,
-            'response_type': 'code',
-            'redirect_uri': REDIRECT_URI,
-            'scope': SCOPE,
-        }
-        return f"https://accounts.spotify.com/authorize?{urlencode(params)}"
-        #part above gives the specific link (spotify API source) to user so they can get Client ID and Client Secret.
+class StepSpinBox(QSpinBox):
+    #Relative step in percent: "Off" at 0 (the profile uses its slider), "+5%" / "-5%" otherwise
 
-    def exchange_code(self, code):
-        #This part gets access_tokens and refresh_Tokens. With access_tokens app serves the user and with refresh_tokens
-        #app gets fresh access_tokens. Access_tokens are active for an hour so it's a necessary part for app to work.
-        try:
-            data = {
-                'grant_type': 'authorization_code',
-                'code': code,
-                'redirect_uri': REDIRECT_URI,
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-            }
-            r = requests.post('https://accounts.spotify.com/api/token', data=data)
-            if r.status_code == 200:
-                tokens = r.json()
-                self.access_token = tokens['access_token']
-                self.refresh_token = tokens.get('refresh_token')
-                self.save_tokens()
-                return True, "Successfully authenticated!"
-            else:
-                return False, f"Token exchange failed: {r.status_code} - {r.text}"
-        except Exception as e:
-            return False, f"Error exchanging code: {e}"
+    def textFromValue(self, value):
+        return f"{value:+d}%" if value else "Off"
 
-    def refresh_access_token(self):
-        """Refresh the access token using refresh token"""
-        if not self.refresh_token:
-            return False, "No refresh token available"
+    def valueFromText(self, text):
+        text = text.strip().rstrip("%").strip()
+        return 0 if not text or text.lower() == "off" else int(text)
 
+    def validate(self, text, pos):
+        stripped = text.strip().rstrip("%").strip()
+        if stripped.lower() == "off":
+            return QValidator.Acceptable, text, pos
+        if "off".startswith(stripped.lower()) or stripped in ("+", "-"):
+            return QValidator.Intermediate, text, pos  # still typing
         try:
-            data = {
-                'grant_type': 'refresh_token',
-                'refresh_token': self.refresh_token,
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-            }
-            r = requests.post('https://accounts.spotify.com/api/token', data=data)
-            if r.status_code == 200:
-                tokens = r.json()
-                self.access_token = tokens['access_token']
-                # Refresh token might be updated
-                if 'refresh_token' in tokens:
-                    self.refresh_token = tokens['refresh_token']
-                self.save_tokens()
-                return True, "Token refreshed successfully"
-            else:
-                return False, f"Token refresh failed: {r.status_code}"
-        except Exception as e:
-            return False, f"Error refreshing token: {e}"
-        #Part above refreshes token that user gave and gives feedback about situation of the token since it's essential
-
-
-class CallbackHandler(BaseHTTPRequestHandler):
-    """HTTP server to handle OAuth callback"""
-    auth_code = None
-
-    def do_GET(self):
-        if '/callback' in self.path:
-            # Extracts code from query parameters
-            if '?code=' in self.path:
-                code = self.path.split('?code=')[1].split('&')[0]
-                CallbackHandler.auth_code = code
-
-                # Sends success response
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                self.wfile.write(b"""
-                    <html>
-                    <body>
-                        <h1>Success!</h1>
-                        <p>You can close this window and return to the application.</p>
-                    </body>
-                    </html>
-                """)
-            else:
-                # Send error response
-                self.send_response(400)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                self.wfile.write(b'<h1>Error: No code received</h1>')
-        else:
-            self.send_response(404)
-            self.end_headers()
-        #Those functions create mini web server so Spotify can send it's data to there.
-
-    def log_message(self, format, *args):
-        pass  # Suppress server logs
-
-
-class AuthSignals(QObject):
-    """Signals for OAuth callbacks"""
-    auth_complete = pyqtSignal(bool, str)
+            value = int(stripped)
+        except ValueError:
+            return QValidator.Invalid, text, pos
+        if self.minimum() <= value <= self.maximum():
+            return QValidator.Acceptable, text, pos
+        return QValidator.Intermediate, text, pos
 
 
 class ProfileWidget(QGroupBox):
     #Widget for a single profile (slider, hotkey, bind/unbind/apply)
+    # Emitted on every edit, so the window can keep its ProfileStore in step with the fields
+    changed = pyqtSignal()
 
-    def __init__(self, title: str, set_volume_callback):
+    def __init__(self, title: str, apply_callback, binding_callback):
         super().__init__(title)
-        self.set_volume_callback = set_volume_callback
-        self.bound_hotkey_id = None
+        # apply_callback(cfg) queues this profile's volume change
+        self.apply_callback = apply_callback
+        # binding_callback(widget) re-registers all hotkeys and returns an error message for this one, or None
+        self.binding_callback = binding_callback
+        self.bound = False
+
+        # profile name
+        self.name_input = QLineEdit(title)
 
         # volume slider
         self.slider = QSlider(Qt.Horizontal)
@@ -263,6 +169,30 @@ class ProfileWidget(QGroupBox):
         self.slider.setTickInterval(5)
         self.slider.valueChanged.connect(self.on_slider_change)
         self.value_label = QLabel("50%")
+        self.current_label = QLabel("")
+        self.current_label.setToolTip("Spotify's current volume")
+
+        # relative step instead of the slider's absolute volume
+        self.step_input = StepSpinBox()
+        self.step_input.setRange(-50, 50)
+        self.step_input.setToolTip("Change the volume by this much from the current one, e.g. +5 or -5.\n"
+                                   "Holding the hotkey keeps stepping. Off uses the slider's volume.")
+        self.step_input.valueChanged.connect(self.on_step_change)
+
+        # fade settings
+        self.fade_input = QDoubleSpinBox()
+        self.fade_input.setRange(0.0, 10.0)
+        self.fade_input.setSingleStep(0.1)
+        self.fade_input.setSuffix(" s")
+        self.curve_combo = QComboBox()
+        self.curve_combo.addItems(list(FADE_CURVES))
+
+        # target device (Web API only)
+        self.device_input = QLineEdit()
+        self.device_input.setPlaceholderText("Active device")
+        self.device_input.setToolTip("Spotify Connect device name to target in Web API mode.\n"
+                                     "Separate several with commas, prefix another account with its name:\n"
+                                     "PC, Speaker, work:Kitchen")
 
         # hotkey input
         self.hotkey_input = QLineEdit()
@@ -279,12 +209,34 @@ class ProfileWidget(QGroupBox):
 
         # layout
         layout = QVBoxLayout()
+        n_layout = QHBoxLayout()
+        n_layout.addWidget(QLabel("Name:"))
+        n_layout.addWidget(self.name_input)
+        layout.addLayout(n_layout)
+
         s_layout = QHBoxLayout()
         s_layout.addWidget(QLabel("Volume:"))
         s_layout.addWidget(self.slider)
         s_layout.addWidget(self.value_label)
+        s_layout.addWidget(self.current_label)
         layout.addLayout(s_layout)
 
+        st_layout = QHBoxLayout()
+        st_layout.addWidget(QLabel("Step:"))
+        st_layout.addWidget(self.step_input)
+        layout.addLayout(st_layout)
+
+        f_layout = QHBoxLayout()
+        f_layout.addWidget(QLabel("Fade:"))
+        f_layout.addWidget(self.fade_input)
+        f_layout.addWidget(self.curve_combo)
+        layout.addLayout(f_layout)
+
+        d_layout = QHBoxLayout()
+        d_layout.addWidget(QLabel("Device:"))
+        d_layout.addWidget(self.device_input)
+        layout.addLayout(d_layout)
+
         hk_layout = QHBoxLayout()
         hk_layout.addWidget(QLabel("Hotkey:"))
         hk_layout.addWidget(self.hotkey_input)
@@ -297,83 +249,149 @@ class ProfileWidget(QGroupBox):
         layout.addLayout(btn_layout)
 
         self.setLayout(layout)
+
+        for signal in (self.name_input.textChanged, self.slider.valueChanged, self.step_input.valueChanged,
+                       self.fade_input.valueChanged, self.curve_combo.currentIndexChanged,
+                       self.device_input.textChanged, self.hotkey_input.textChanged):
+            signal.connect(lambda *args: self.changed.emit())
     #all codes in this function used to create buttons and layouts for profile part
 
     def on_slider_change(self, v):
         self.value_label.setText(f"{v}%")
 
+    def on_step_change(self, step):
+        self.slider.setEnabled(step == 0)
+        self.value_label.setText(f"{step:+d}%" if step else f"{self.slider.value()}%")
+
+    def show_current_volume(self, volume):
+        self.current_label.setText("" if volume is None else f"(now {volume}%)")
+
+    def set_config(self, cfg):
+        self.name_input.setText(cfg.get("name", ""))
+        self.slider.setValue(int(cfg.get("volume", 50)))
+        self.step_input.setValue(int(cfg.get("step", 0)))
+        self.fade_input.setValue(float(cfg.get("fade", 0.0)))
+        curve_index = self.curve_combo.findText(cfg.get("curve", "Linear"))
+        if curve_index >= 0:
+            self.curve_combo.setCurrentIndex(curve_index)
+        self.device_input.setText(cfg.get("device", ""))
+        self.hotkey_input.setText(cfg.get("hotkey", ""))
+        self.set_bound(bool(cfg.get("bound")))
+
+    def set_bound(self, bound):
+        self.bound = bound
+        self.bind_btn.setEnabled(not bound)
+        self.unbind_btn.setEnabled(bound)
+        self.hotkey_input.setReadOnly(bound)
+        self.changed.emit()
+
     def get_config(self):
         return {
+            "name": self.name_input.text().strip(),
             "volume": int(self.slider.value()),
-            "hotkey": self.hotkey_input.text().strip()
+            "step": int(self.step_input.value()),
+            "fade": float(self.fade_input.value()),
+            "curve": self.curve_combo.currentText(),
+            "device": self.device_input.text().strip(),
+            "hotkey": self.hotkey_input.text().strip(),
+            "bound": self.bound
         }
 
     def apply_now(self):
-        cfg = self.get_config()
-        threading.Thread(target=self.set_volume_callback, args=(cfg["volume"],), daemon=True).start()
+        self.apply_callback(self.get_config())
 
     def bind_hotkey(self):
-        try:
-            import keyboard
-        except ImportError:
+        keyboard = optional_import("keyboard")
+        if keyboard is None:
             QMessageBox.warning(self, "keyboard not available",
                                 "Install the 'keyboard' package to use global hotkeys.")
             return
 
-        cfg = self.get_config()
-        key = cfg["hotkey"]
+        key = self.hotkey_input.text().strip()
         if not key:
             QMessageBox.information(self, "No hotkey", "Enter a hotkey to bind (e.g. F9).")
             return
-        if self.bound_hotkey_id is not None:
+        if self.bound:
             QMessageBox.information(self, "Already bound", f"Already bound to {key}. Unbind first.")
             return
 
-        try:
-            import keyboard
-            handler = keyboard.add_hotkey(
-                key,
-                lambda: threading.Thread(
-                    target=self.set_volume_callback,
-                    args=(cfg["volume"],),
-                    daemon=True
-                    #daemon is used for background running. It makes background threads stop automatically.
-                    #we do it here instead of main so entire GUI won't freeze. It makes critical callbacks run in
-                    #background so app can work with flow
-
-                ).start()
-            )
-            self.bound_hotkey_id = handler
-            self.bind_btn.setEnabled(False)
-            self.unbind_btn.setEnabled(True)
-        except Exception as e:
-            QMessageBox.warning(self, "Bind failed",
-                                f"Could not bind hotkey: {e}\n\n{traceback.format_exc()}")
+        # All profiles share one keyboard hook, so binding means rebuilding the table with this profile in it
+        self.set_bound(True)
+        error = self.binding_callback(self)
+        if error:
+            # Rebuild without this profile so the table and the buttons agree
+            self.set_bound(False)
+            self.binding_callback(self)
+            QMessageBox.warning(self, "Bind failed", f"Could not bind hotkey: {error}")
 
     def unbind_hotkey(self):
-        try:
-            import keyboard
-        except ImportError:
-            return
-
-        if self.bound_hotkey_id is None:
+        if not self.bound:
             QMessageBox.information(self, "Not bound", "No hotkey is currently bound.")
             return
-        try:
-            keyboard.remove_hotkey(self.bound_hotkey_id)
-        except Exception:
-            key = self.hotkey_input.text().strip()
-            if key:
-                try:
-                    keyboard.remove_hotkey(key)
-                except Exception:
-                    pass
-        self.bound_hotkey_id = None
-        self.bind_btn.setEnabled(True)
-        self.unbind_btn.setEnabled(False)
+        self.set_bound(False)
+        self.binding_callback(self)
         #The function above unbinds the hotkey and disables the ‘Unbind’ button if no key is currently bound.
 
 
+class StatsWidget(QWidget):
+    #Latency of every stage (hook → dispatch → token → HTTP/COM call → status shown) per backend.
+    #Only refreshes while its tab is visible.
+    REFRESH_MS = 1000
+
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+        self.columns = ["Backend", "Stage", "Count"] + [f"p{p} ms" for p in LATENCY_PERCENTILES]
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.dispatch_label = QLabel("")
+        self.reset_btn = QPushButton("Reset")
+        self.reset_btn.clicked.connect(self.reset)
+
+        bottom = QHBoxLayout()
+        bottom.addWidget(self.dispatch_label, 1)
+        bottom.addWidget(self.reset_btn)
+        layout = QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(bottom)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, ev):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(ev)
+
+    def hideEvent(self, ev):
+        self.timer.stop()
+        super().hideEvent(ev)
+
+    def refresh(self):
+        rows = []
+        for backend, stages in self.controller.latency.summary().items():
+            for stage, values in stages.items():
+                rows.append([backend, stage, values["count"]] + [values[f"p{p}"] for p in LATENCY_PERCENTILES])
+        self.table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                self.table.setItem(r, c, QTableWidgetItem(str(value)))
+        health = self.controller.health_stats()
+        self.dispatch_label.setText("   ".join(
+            f"{backend}: {stats['executed']}/{stats['submitted']} sent, {stats['coalesced']} coalesced, "
+            f"circuit {health[backend]['state']}"
+            for backend, stats in self.controller.dispatch_stats().items()))
+
+    def reset(self):
+        self.controller.latency.clear()
+        self.refresh()
+
+
 class MainWindow(QWidget):
     #Main class. It has all the details of design and bindings of buttons.
     def __init__(self):
@@ -389,10 +407,27 @@ class MainWindow(QWidget):
         # Check for optional libraries
         self.check_dependencies()
 
+        # The volume pipeline itself lives in spotivol_core, the window only shows its results.
+        # Results go through the aggregator so a burst of them is one label update per frame.
+        self.status_updates = StatusAggregator(self._show_status, self._schedule_status_flush)
+        self.controller = VolumeController(self.spotify_auth, on_status=self._set_status,
+                                           local_available=self.LOCAL_AVAILABLE)
+        self.controller.playback.listeners.append(self._on_playback_change)
+        for auth in self.spotify_auth.extra_accounts():
+            self.controller.add_account(auth)
+
         # Top controls
         self.mode_combo = QComboBox()
-        self.mode_combo.addItems(["Local (Windows, pycaw)", "Spotify Web API"])
-        self.mode_combo.currentIndexChanged.connect(self.on_mode_change)
+        # Only the Local mode this platform has, pycaw on Windows and PulseAudio/PipeWire elsewhere
+        self.mode_combo.addItems([local_mode(), MODE_API, MODE_HEDGED])
+
+        # Which Spotify account Login/Logout act on. Profiles reach the others as "account:device".
+        self.account_combo = QComboBox()
+        for name, account in self.controller.accounts.items():
+            self.account_combo.addItem(account.auth.label, name)
+        self.account_combo.currentIndexChanged.connect(lambda index: self.update_auth_ui())
+        self.add_account_btn = QPushButton("+ Account")
+        self.add_account_btn.clicked.connect(self.add_account)
 
         # Login button for Spotify API
         self.login_btn = QPushButton("Login to Spotify")
@@ -408,16 +443,22 @@ class MainWindow(QWidget):
         top_layout = QHBoxLayout()
         top_layout.addWidget(QLabel("Mode:"))
         top_layout.addWidget(self.mode_combo)
+        top_layout.addWidget(self.account_combo)
+        top_layout.addWidget(self.add_account_btn)
         top_layout.addWidget(self.login_btn)
         top_layout.addWidget(self.settings_btn)
         top_layout.addWidget(self.logout_btn)
 
-        # Tabs for profiles
-        self.tabs = QTabWidget()
-        self.profile1 = ProfileWidget("Profile 1", self.apply_volume)
-        self.profile2 = ProfileWidget("Profile 2", self.apply_volume)
-        self.tabs.addTab(self.profile1, "Profile 1")
-        self.tabs.addTab(self.profile2, "Profile 2")
+        # Tabs for profiles, as many as the user wants
+        self.store = ProfileStore()
+        self.hotkeys = None
+        # "record_trace" in the settings records every press for spotivol_soak.py to replay
+        trace_path = self.spotify_auth.extra_settings.get("record_trace")
+        self.trace_recorder = TraceRecorder(trace_path) if trace_path else None
+        # The tabs are built by build_profile_ui(). In tray mode they only exist while the window is open.
+        self.profile_widgets = []
+        self.tabs = None
+        self.stats_widget = None
 
         # Status label
         self.status_label = QLabel("")
@@ -425,37 +466,268 @@ class MainWindow(QWidget):
 
         layout = QVBoxLayout()
         layout.addLayout(top_layout)
-        layout.addWidget(self.tabs)
         layout.addWidget(self.status_label)
         self.setLayout(layout)
 
+        # "tray_mode" in the settings (or --tray) keeps SpotiVol in the system tray while the window is closed
+        self.tray = None
+        self._quitting = False
+        if self.spotify_auth.extra_settings.get("tray_mode") and QSystemTrayIcon.isSystemTrayAvailable():
+            self.setup_tray()
+
         # Update UI based on current auth state
         self.update_auth_ui()
 
         # initial state
-        self.on_mode_change(0)
+        self.load_saved_profiles()
+        self.mode_combo.currentIndexChanged.connect(self.on_mode_change)
+        self.on_mode_change(self.mode_combo.currentIndex())
+        # Switching to a Web API mode opens its connections right away, start() does it for the saved mode
+        self.mode_combo.currentIndexChanged.connect(lambda index: self.controller.warm_up())
+        self.controller.start()
+
+        # Scripts can apply profiles through this socket, see spotivol_control for the protocol
+        self.control_server = ControlServer(self.controller, lambda: self.store.profiles,
+                                            self.spotify_auth.extra_settings.get("control_endpoint"))
+        ok, msg = self.control_server.start()
+        print(msg)
+        self.metrics_server = MetricsServer(self.controller, self.spotify_auth.extra_settings.get("metrics_port"))
+        ok, msg = self.metrics_server.start()
+        if ok:
+            print(msg)
 
     def check_dependencies(self):
-        #this function checks are optional dependencies are available or not.
-        self.LOCAL_AVAILABLE = False
-        self.KEYBOARD_AVAILABLE = False
-
-        try:
-            from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
-            from comtypes import CLSCTX_ALL
-            self.LOCAL_AVAILABLE = True
-        except Exception:
-            pass
-
-        try:
-            import keyboard
-            self.KEYBOARD_AVAILABLE = True
-        except Exception:
-            pass
+        #Optional dependencies are checked by load_optional_backends once the window is up.
+        #None means "not checked yet".
+        self.LOCAL_AVAILABLE = None
+        self.KEYBOARD_AVAILABLE = None
+
+    def load_optional_backends(self):
+        #Called right after the window is shown. keyboard and pycaw are slow to import, so they load on a
+        #background thread instead of holding up the window.
+        STARTUP.mark("first event loop tick")
+
+        def load():
+            keyboard_ok = optional_import("keyboard") is not None
+            local_ok = local_mode_available()
+            QApplication.instance().postEvent(self, _CallableEvent(lambda: self._on_backends_loaded(keyboard_ok,
+                                                                                                   local_ok)))
+
+        threading.Thread(target=load, name="backend-loader", daemon=True).start()
+
+    def _on_backends_loaded(self, keyboard_ok, local_ok):
+        self.KEYBOARD_AVAILABLE = keyboard_ok
+        self.LOCAL_AVAILABLE = local_ok
+        self.controller.local_available = local_ok
+        self.on_mode_change(self.mode_combo.currentIndex())
+        configs = self.profile_configs()
+        if not keyboard_ok:
+            self.status_label.setText("⚠ 'keyboard' package not available. Hotkeys are disabled.")
+            self._unbind_profiles(range(len(configs)))
+        elif any(cfg["bound"] for cfg in configs):
+            # Restore every saved binding in one go
+            errors = self.rebuild_hotkeys()
+            failed = [i for i in range(len(configs)) if i in errors]
+            self._unbind_profiles(failed)
+            if failed:
+                self.rebuild_hotkeys()
+                self.status_label.setText("⚠ Could not restore hotkeys for: " +
+                                          ", ".join(configs[i]["name"] for i in failed))
+        STARTUP.mark("optional backends loaded")
+        if STARTUP.enabled:
+            print(STARTUP.report("window shown"))
+            QApplication.instance().exit(1 if STARTUP.over_budget("window shown") else 0)
+
+    def load_saved_profiles(self):
+        #Restores the mode and every profile saved in spotify_profiles.json. Bound hotkeys are registered once the
+        #keyboard package has loaded (see _on_backends_loaded).
+        if self.store.mode in MODE_BACKENDS:
+            # A Local mode saved on the other platform opens as this platform's
+            self.mode_combo.setCurrentText(platform_mode(self.store.mode))
+        self.build_profile_ui()
+
+    def build_profile_ui(self):
+        #The heavy part of the window: a tab of sliders and fields per profile, plus the Stats tab.
+        #Built from self.store, which is where the profiles live while the tabs don't exist.
+        if self.tabs is not None:
+            return
+        self.tabs = QTabWidget()
+        self.add_profile_btn = QPushButton("+ Profile")
+        self.add_profile_btn.clicked.connect(lambda: self.add_profile_tab())
+        self.remove_profile_btn = QPushButton("Remove Profile")
+        self.remove_profile_btn.clicked.connect(self.remove_current_profile)
+        profile_btns = QWidget()
+        profile_btns_layout = QHBoxLayout()
+        profile_btns_layout.setContentsMargins(0, 0, 0, 0)
+        profile_btns_layout.addWidget(self.add_profile_btn)
+        profile_btns_layout.addWidget(self.remove_profile_btn)
+        profile_btns.setLayout(profile_btns_layout)
+        self.tabs.setCornerWidget(profile_btns)
+        self.stats_widget = StatsWidget(self.controller)
+        self.tabs.addTab(self.stats_widget, "Stats")
+        # Between the top controls and the status label
+        self.layout().insertWidget(1, self.tabs)
+        for cfg in self.store.profiles:
+            self.add_profile_tab(cfg)
+        self.tabs.setCurrentIndex(0)
+
+    def teardown_profile_ui(self):
+        #Tray mode: destroy the tabs and everything in them once the window is hidden. The profiles are saved to
+        #self.store first, and the hotkeys keep working since their actions don't touch any widget.
+        if self.tabs is None:
+            return
+        self.save_current_profiles()
+        self.layout().removeWidget(self.tabs)
+        self.tabs.deleteLater()
+        self.tabs = self.stats_widget = self.add_profile_btn = self.remove_profile_btn = None
+        self.profile_widgets = []
+
+    def _unbind_profiles(self, indexes):
+        for index in indexes:
+            if self.tabs is not None:
+                self.profile_widgets[index].set_bound(False)
+            else:
+                self.store.profiles[index]["bound"] = False
+
+    def add_profile_tab(self, cfg=None):
+        if cfg is None:
+            cfg = self.store.add()
+        widget = ProfileWidget(cfg["name"], self.apply_profile, self.on_binding_change)
+        widget.set_config(cfg)
+        widget.name_input.textChanged.connect(lambda text, w=widget: self.tabs.setTabText(self.tabs.indexOf(w), text))
+        self.profile_widgets.append(widget)
+        widget.changed.connect(self.sync_store)
+        # Profile tabs go before the Stats tab
+        self.tabs.insertTab(len(self.profile_widgets) - 1, widget, cfg["name"])
+        self.tabs.setCurrentWidget(widget)
+        self.remove_profile_btn.setEnabled(len(self.profile_widgets) > 1)
+
+    def remove_current_profile(self):
+        widget = self.tabs.currentWidget()
+        if widget not in self.profile_widgets or len(self.profile_widgets) <= 1:
+            return
+        index = self.profile_widgets.index(widget)
+        self.profile_widgets.pop(index)
+        self.sync_store()
+        self.tabs.removeTab(self.tabs.indexOf(widget))
+        widget.deleteLater()
+        self.remove_profile_btn.setEnabled(len(self.profile_widgets) > 1)
+        if widget.bound:
+            self.rebuild_hotkeys()
+        self.save_current_profiles()
+
+    def on_binding_change(self, widget):
+        #The profile being bound goes last, so if its hotkey is taken the profile that already has it keeps it
+        index = self.profile_widgets.index(widget)
+        errors = self.rebuild_hotkeys(last=index if widget.bound else None)
+        self.save_current_profiles()
+        if errors is None:
+            return "Install the 'keyboard' package to use global hotkeys."
+        return errors.get(index)
+
+    def rebuild_hotkeys(self, last=None):
+        #One keyboard hook for every bound profile. Volume, fade and backends are resolved here, not on each press.
+        #When two profiles share a hotkey the earlier one in the table keeps it, last (a profile index) goes after
+        #all the others. Returns {profile index: error}, or None if the keyboard package isn't available.
+        if self.hotkeys is None:
+            keyboard = optional_import("keyboard")
+            if keyboard is None:
+                return None
+            self.hotkeys = HotkeyTable(keyboard)
+        bindings = []
+        for index, cfg in enumerate(self.profile_configs()):
+            if cfg["bound"]:
+                action = self.controller.prepare_profile(cfg)
+                if self.trace_recorder is not None:
+                    action = self.trace_recorder.wrap(index, cfg, action)
+                bindings.append((index, cfg["hotkey"], action))
+        bindings.sort(key=lambda binding: binding[0] == last)
+        return self.hotkeys.rebuild(bindings)
+
+    def sync_store(self):
+        #self.store always holds what the tabs show. The list is replaced, never edited in place, so the control
+        #server's thread can read it without touching a widget.
+        if self.tabs is not None:
+            self.store.profiles = [widget.get_config() for widget in self.profile_widgets]
+
+    def profile_configs(self):
+        return [dict(cfg) for cfg in self.store.profiles]
+
+    def save_current_profiles(self):
+        self.store.mode = self.mode_combo.currentText()
+        self.sync_store()
+        self.store.save()
+
+    def setup_tray(self):
+        self.tray = QSystemTrayIcon(QIcon(os.path.join(os.path.dirname(os.path.abspath(__file__)), "favicon.ico")),
+                                    self)
+        self.tray.setToolTip("SpotiVol")
+        menu = QMenu(self)
+        menu.addAction("Open SpotiVol", self.show_from_tray)
+        menu.addAction("Quit", self.quit_from_tray)
+        self.tray.setContextMenu(menu)
+        self.tray.activated.connect(
+            lambda reason: self.show_from_tray() if reason == QSystemTrayIcon.Trigger else None)
+        self.tray.show()
+        QApplication.instance().setQuitOnLastWindowClosed(False)
+
+    def hide_to_tray(self):
+        self.hide()
+        self.teardown_profile_ui()
+        QTimer.singleShot(TRAY_RELEASE_DELAY_MS, release_freed_memory)
+
+    def show_from_tray(self):
+        self.build_profile_ui()
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+    def quit_from_tray(self):
+        self._quitting = True
+        self.close()
+        QApplication.instance().quit()
+
+    def closeEvent(self, ev):
+        if self.tray is not None and not self._quitting:
+            # Closing the window only sends SpotiVol to the tray, Quit in the tray menu really exits
+            ev.ignore()
+            self.hide_to_tray()
+            return
+        #Saving on close means headless mode picks up whatever was set up here
+        self.save_current_profiles()
+        if self.hotkeys is not None:
+            self.hotkeys.clear()
+        if self.trace_recorder is not None:
+            self.trace_recorder.save()
+        self.control_server.stop()
+        self.metrics_server.stop()
+        self.controller.close()
+        super().closeEvent(ev)
+
+    def selected_auth(self):
+        return self.controller.accounts[self.account_combo.currentData()].auth
+
+    def add_account(self):
+        #Another Spotify account (e.g. a second user on the same speaker). It uses the same API credentials.
+        name, ok = QInputDialog.getText(self, "Add Spotify Account",
+                                        "Name for the account (used in profiles as name:device):")
+        name = name.strip()
+        if not ok or not name:
+            return
+        if name in self.controller.accounts or not valid_account_name(name):
+            QMessageBox.warning(self, "Invalid Name", f"'{name}' can't be used as an account name.\n"
+                                "Use letters, digits, spaces, - and _ only.")
+            return
+        auth = SpotifyAuth(name, api_client=self.spotify_auth.api_client)
+        self.controller.add_account(auth)
+        self.spotify_auth.extra_settings['accounts'] = [n for n in self.controller.accounts if n]
+        self.spotify_auth.save_settings()
+        self.account_combo.addItem(auth.label, name)
+        self.account_combo.setCurrentIndex(self.account_combo.count() - 1)
 
     def update_auth_ui(self):
         #Updates buttons, labels based on whether used logged into Spotify API.
-        if self.spotify_auth.access_token:
+        if self.selected_auth().access_token:
             self.login_btn.setEnabled(False)
             self.logout_btn.setEnabled(True)
             self.status_label.setText("✓ Logged in to Spotify API")
@@ -475,8 +747,10 @@ class MainWindow(QWidget):
             client_id, client_secret = dialog.get_credentials()
 
             if client_id and client_secret:
-                self.spotify_auth.client_id = client_id
-                self.spotify_auth.client_secret = client_secret
+                # Every account logs in through the same Spotify app
+                for account in self.controller.accounts.values():
+                    account.auth.client_id = client_id
+                    account.auth.client_secret = client_secret
                 self.spotify_auth.save_settings()
                 QMessageBox.information(self, "Settings Saved",
                                         "API credentials saved! You can now login to Spotify.")
@@ -498,32 +772,31 @@ class MainWindow(QWidget):
                 self.open_settings()
             return
 
+        # The callback listener and the token exchange run on the I/O engine's loop, the result comes back
+        # through auth_signals (2 minute timeout to make it safe)
+        auth = self.selected_auth()
+        try:
+            login = auth.start_login(timeout=120)
+        except OSError as e:
+            QMessageBox.warning(self, "Login Failed", f"Could not listen for Spotify's answer: {e}")
+            return
         self.status_label.setText("Opening browser for Spotify login...")
+        login.add_done_callback(self._on_login_done)
+        webbrowser.open(auth.get_auth_url())
 
-        # Start callback server in background thread
-        def run_server():
-            server = HTTPServer(('127.0.0.1', 8888), CallbackHandler)
-            server.timeout = 120  # 2 minute timeout to make it safe
-            CallbackHandler.auth_code = None
-
-            # Open browser
-            webbrowser.open(self.spotify_auth.get_auth_url())
-
-            # Wait for callback
-            server.handle_request()
-
-            # Process the code
-            if CallbackHandler.auth_code:
-                success, message = self.spotify_auth.exchange_code(CallbackHandler.auth_code)
-                self.auth_signals.auth_complete.emit(success, message)
-            else:
-                self.auth_signals.auth_complete.emit(False, "No authorization code received")
-
-        threading.Thread(target=run_server, daemon=True).start()
+    def _on_login_done(self, future):
+        #Runs on the I/O loop thread, the signal carries the result over to the GUI thread
+        try:
+            success, message = future.result()
+        except Exception as e:
+            success, message = False, f"Login error: {e}"
+        self.auth_signals.auth_complete.emit(success, message)
 
     def on_auth_complete(self, success, message): #Messages to send when everything goes smooth
         if success:
             self.update_auth_ui()
+            # Connect now so the first press after logging in doesn't pay for the handshake
+            self.controller.warm_up()
             QMessageBox.information(self, "Success", "Successfully logged in to Spotify!")
         else:
             QMessageBox.warning(self, "Login Failed", f"Failed to login: {message}")
@@ -531,128 +804,100 @@ class MainWindow(QWidget):
 
     def logout_spotify(self):
         #Removes all credentials when logging out.
-        self.spotify_auth.access_token = None
-        self.spotify_auth.refresh_token = None
-        if os.path.exists(TOKEN_FILE):
-            os.remove(TOKEN_FILE)
+        auth = self.selected_auth()
+        auth.forget_tokens()
+        self.controller.forget_account(auth.name)
         self.update_auth_ui()
         self.status_label.setText("Logged out from Spotify")
 
     def on_mode_change(self, index):
-        #With this code macOS-Linux users will get error on local mode since I've used pycaw.
         mode_text = self.mode_combo.currentText()
-        if "Local" in mode_text:
-            self.login_btn.setVisible(False)
-            self.settings_btn.setVisible(False)
-            self.logout_btn.setVisible(False)
-            if not self.LOCAL_AVAILABLE:
+        self.controller.mode = mode_text
+        if self.hotkeys is not None:
+            # Hotkeys resolve their backends when they're registered, so register them again for the new mode
+            self.rebuild_hotkeys()
+        if mode_text == MODE_HEDGED:
+            self._show_api_controls(True)
+            available = []
+            if self.LOCAL_AVAILABLE:
+                available.append("Local")
+            if self.spotify_auth.access_token:
+                available.append("Web API")
+            if available:
                 self.status_label.setText(
-                    "Local mode not available: pycaw/comtypes not installed or not running on Windows.")
+                    f"Hedged mode. Each press goes to {' and '.join(available)}, the first one to answer wins.")
+            else:
+                self.status_label.setText(
+                    "Hedged mode needs local audio (pycaw or pulsectl) or a Spotify login. Neither is available yet.")
+        elif mode_text in LOCAL_MODE_BACKENDS:
+            self._show_api_controls(False)
+            library = "pycaw" if local_backend() == "pycaw" else "pulsectl"
+            if self.LOCAL_AVAILABLE is None:
+                self.status_label.setText(f"Local mode selected. Loading {library}...")
+            elif not self.LOCAL_AVAILABLE:
+                self.status_label.setText(f"Local mode not available: {library} is not installed.")
             else:
                 self.status_label.setText("Local mode selected. Hotkeys will change the Spotify desktop app volume.")
         else:
-            self.login_btn.setVisible(True)
-            self.settings_btn.setVisible(True)
-            self.logout_btn.setVisible(True)
+            self._show_api_controls(True)
             if self.spotify_auth.access_token:
                 self.status_label.setText("Spotify Web API mode. You're logged in!")
             else:
                 self.status_label.setText("Spotify Web API mode. Configure API settings and login to authenticate.")
 
-    def apply_volume(self, volume: int):
-        #Codes to apply volume that is chosen and messages to give as feedback when tokens run out
-        mode_text = self.mode_combo.currentText()
-        try:
-            if "Local" in mode_text:
-                ok, msg = self._set_local_spotify_volume(volume)
-                self._set_status(ok, msg)
-            else:
-                if not self.spotify_auth.access_token:
-                    self._set_status(False, "Not logged in. Click 'Login to Spotify' first.")
-                else:
-                    ok, msg = self._set_spotify_api_volume(volume)
-                    # If token expired, try to refresh
-                    if not ok and "401" in msg:
-                        refresh_ok, refresh_msg = self.spotify_auth.refresh_access_token()
-                        if refresh_ok:
-                            # Retry with new token that is given
-                            ok, msg = self._set_spotify_api_volume(volume)
-                        else:
-                            msg = f"Token expired. Please login again. ({refresh_msg})"
-                    self._set_status(ok, msg)
-        except Exception as e:
-            self._set_status(False, f"Unexpected error: {e}\n{traceback.format_exc()}")
+    def _show_api_controls(self, visible):
+        for widget in (self.account_combo, self.add_account_btn, self.login_btn, self.settings_btn, self.logout_btn):
+            widget.setVisible(visible)
 
-    def _set_status(self, ok: bool, message: str):
+    def apply_volume(self, volume: int, fade: float = 0.0, curve: str = "Linear", device: str = ""):
+        #Queues the volume on the dispatcher of the selected mode. Safe to call from any thread, returns immediately.
+        self.controller.apply_volume(volume, fade, curve, device)
 
-        def updater():
-            if ok:
-                self.status_label.setText(f"✓ {message}")
-            else:
-                self.status_label.setText(f"✗ {message}")
+    def apply_profile(self, cfg):
+        #Same as pressing the profile's hotkey: an absolute volume, or a step from the current one
+        self.controller.prepare_profile(cfg)()
 
-        QApplication.instance().postEvent(self, _CallableEvent(updater))
+    def dispatch_stats(self):
+        return self.controller.dispatch_stats()
 
-    def _set_local_spotify_volume(self, percent: int):
-        if not self.LOCAL_AVAILABLE:
-            return False, "pycaw not available (Local mode is supported only on Windows)."
+    def _set_status(self, ok, message: str):
+        #ok=None is used for "still working on it" messages like waiting for the rate limit
+        #The latency trace stops once the label has actually been updated, not when the event was posted.
+        source = self.controller.status_source() or "app"
+        self.status_updates.post(source, ok, message, self.controller.claim_status_trace())
 
-        try:
-            import comtypes
-            from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
-
-            # Initialize COM for this thread
-            comtypes.CoInitialize()
-            #The code above must be used for pycaw to communicate with Windows audio system. Without this code it simply
-            #won't work because of lack of connection.
-
-            try:
-                sessions = AudioUtilities.GetAllSessions()
-                spotify_found = False
-
-                for session in sessions:
-                    proc = session.Process
-                    if proc and proc.name():
-                        name = proc.name().lower()
-                        if "spotify" in name:
-                            spotify_found = True
-                            try:
-                                vol = session._ctl.QueryInterface(ISimpleAudioVolume)
-                                vol.SetMasterVolume(max(0.0, min(1.0, percent / 100.0)), None)
-                            except Exception as e:
-                                return False, f"Failed to set session volume: {e}"
-
-                if not spotify_found:
-                    return False, "Spotify process not found. Make sure Spotify Desktop is running."
-                return True, f"Local Spotify volume set to {percent}%"
-            finally:
-                comtypes.CoUninitialize()
+    def _schedule_status_flush(self, delay, flush):
+        #Called from any thread, at most once per frame
+        def updater():
+            if delay > 0:
+                QTimer.singleShot(int(delay * 1000), flush)
+            else:
+                flush()
 
-        except Exception as e:
-            return False, f"pycaw error: {e}"
+        QApplication.instance().postEvent(self, _CallableEvent(updater))
 
-    def _set_spotify_api_volume(self, percent: int):
-        """Set volume using Spotify Web API"""
-        try:
-            endpoint = "https://api.spotify.com/v1/me/player/volume"
-            headers = {"Authorization": f"Bearer {self.spotify_auth.access_token}"}
-            params = {"volume_percent": percent}
-            r = requests.put(endpoint, headers=headers, params=params, timeout=8)
+    def _show_status(self, lines, applied, values):
+        #Latest status of each backend, newest last, and how many commands went through since the last redraw
+        if "volume" in values:
+            for profile in self.profile_widgets:
+                profile.show_current_volume(values["volume"])
+        if not lines:
+            return
+        text = "\n".join(f"{'✓' if ok else '⏳' if ok is None else '✗'} {message}" for ok, message in lines)
+        if applied > 1:
+            text += f"\n{applied} commands applied"
+        self.status_label.setText(text)
+        if self.tray is not None:
+            self.tray.setToolTip(f"SpotiVol\n{text}")
 
-            if r.status_code in (204, 202):
-                return True, f"Spotify API volume set to {percent}%"
-            else:
-                try:
-                    j = r.json()
-                    return False, f"API error {r.status_code}: {j.get('error', {}).get('message', j)}"
-                except Exception:
-                    return False, f"API error {r.status_code}: {r.text}"
-        except Exception as e:
-            return False, f"Request error: {e}"
+    def _on_playback_change(self, state):
+        #Every write and fade step changes it, so it waits for the next status frame like the results do
+        self.status_updates.post_value("volume", state.volume)
 
     def event(self, ev):
         #Override event to handle all called functions safely
         if isinstance(ev, _CallableEvent):
+            _CallableEvent.handled += 1
             ev.callable()
             return True
         return super().event(ev)
@@ -661,29 +906,37 @@ class MainWindow(QWidget):
 class _CallableEvent(QEvent):
     #It safely runs the UI update so UI won't crash and won't be bugged.
     TYPE = QEvent.Type(QEvent.registerEventType())
+    #Created minus handled is how many are still waiting in Qt's event queue, the soak harness watches it
+    created = 0
+    handled = 0
+    _lock = threading.Lock()
 
     def __init__(self, callable_):
         super().__init__(_CallableEvent.TYPE)
         self.callable = callable_
+        with _CallableEvent._lock:
+            _CallableEvent.created += 1
 
+    @staticmethod
+    def queue_depth():
+        return _CallableEvent.created - _CallableEvent.handled
 
-def main():
-    # Check dependencies at startup
-    try:
-        import keyboard
-        print("✓ keyboard package available")
-    except ImportError:
-        print("⚠ Warning: 'keyboard' package not available. Hotkeys will be disabled.")
-
-    try:
-        from pycaw.pycaw import AudioUtilities
-        print("✓ pycaw package available")
-    except ImportError:
-        print("⚠ Warning: 'pycaw' not available. Local mode will be disabled.")
 
+def main():
+    # keyboard and pycaw are not imported here anymore, the window loads them in the background once it's visible
     app = QApplication(sys.argv)
+    STARTUP.mark("QApplication")
     wnd = MainWindow()
-    wnd.show()
+    STARTUP.mark("MainWindow built")
+    if "--tray" in sys.argv and wnd.tray is None and QSystemTrayIcon.isSystemTrayAvailable():
+        wnd.setup_tray()
+    if "--tray" in sys.argv and wnd.tray is not None:
+        # Start in the tray, the tabs are torn down before they were ever shown
+        wnd.hide_to_tray()
+    else:
+        wnd.show()
+    STARTUP.mark("window shown")
+    QTimer.singleShot(0, wnd.load_optional_backends)
     sys.exit(app.exec_())
 
 
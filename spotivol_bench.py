@@ -0,0 +1,383 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import spotivol_core as core
+from spotivol_core import (MODE_LOCAL, MODE_API, LATENCY_PERCENTILES, AudioSessionProvider, RateLimiter,
+                           SpotifyAuth, VolumeController, PERSISTENCE)
+
+"""
+Benchmarks for SpotiVol's hot path: apply_volume in Local and Web API mode, end to end through the dispatchers.
+The Web API runs against a stand-in Spotify server on 127.0.0.1 (http.server) with configurable latency and
+injectable 401, 429 and 5xx answers, Local mode against fake audio sessions. Nothing touches the real Spotify,
+the real mixer or your saved tokens (it runs in a temporary directory).
+
+    python spotivol_bench.py                          run every scenario
+    python spotivol_bench.py --scenario api-faults --latency 0.05
+    python spotivol_bench.py --save baseline.json     keep the numbers to compare a later build against
+    python spotivol_bench.py --baseline baseline.json exit 1 if p95 latency or throughput got worse than the tolerance
+
+Each scenario reports throughput, latency percentiles (from the controller's own LatencyStats), thread counts
+and, for the Web API, how many requests and token refreshes the server saw.
+"""
+
+BENCH_ACCESS_TOKEN_LIFETIME = 3600
+BENCH_DEVICE = {"id": "bench-device", "name": "Bench", "type": "Computer", "is_active": True,
+                "supports_volume": True}
+DEFAULT_PRESSES = 200
+DEFAULT_TOLERANCE = 0.25
+THREAD_SAMPLE_INTERVAL = 0.005
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """Hands every request to the FakeSpotifyServer it belongs to"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.fake.handle(self, "GET")
+
+    def do_HEAD(self):
+        self.server.fake.handle(self, "HEAD")
+
+    def do_PUT(self):
+        self.server.fake.handle(self, "PUT")
+
+    def do_POST(self):
+        self.server.fake.handle(self, "POST")
+
+    def log_message(self, format, *args):
+        pass  # Suppress server logs
+
+
+class FakeSpotifyServer:
+    """Stand-in for the Spotify accounts service and the parts of the Web API SpotiVol uses.
+    latency is added to every answer. inject() queues error answers for the next volume PUTs."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.volume = 50
+        self.requests = Counter()  # (method and path, status) -> count
+        self.token_requests = 0
+        self._token_serial = 0
+        self.access_token = self._new_token()
+        self._faults = deque()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _new_token(self):
+        self._token_serial += 1
+        return f"bench-token-{self._token_serial}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSpotifyHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, name="fake-spotify", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def inject(self, status, count=1, retry_after=1):
+        """Answer the next count volume PUTs with status. 401 revokes the current access token instead, so the
+        client has to refresh it like it would after a real expiry."""
+        with self._lock:
+            if status == 401:
+                self.access_token = self._new_token()
+                return
+            self._faults.extend([(status, retry_after)] * count)
+
+    def handle(self, handler, method):
+        if self.latency:
+            time.sleep(self.latency)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        parts = urlsplit(handler.path)
+        status, payload, headers = self._route("GET" if method == "HEAD" else method, parts.path,
+                                               parse_qs(parts.query), handler.headers.get("Authorization", ""), body)
+        with self._lock:
+            self.requests[(f"{method} {parts.path}", status)] += 1
+        content = json.dumps(payload).encode() if payload is not None else b""
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        if method != "HEAD":
+            handler.wfile.write(content)
+
+    def _route(self, method, path, query, authorization, body):
+        if method == "POST" and path == "/api/token":
+            with self._lock:
+                self.token_requests += 1
+                self.access_token = self._new_token()
+                return 200, {"access_token": self.access_token, "token_type": "Bearer",
+                             "expires_in": BENCH_ACCESS_TOKEN_LIFETIME}, {}
+        with self._lock:
+            if authorization != f"Bearer {self.access_token}":
+                return 401, {"error": {"status": 401, "message": "The access token expired"}}, {}
+            if method == "GET" and path == "/v1/me/player":
+                return 200, {"device": dict(BENCH_DEVICE, volume_percent=self.volume), "is_playing": True}, {}
+            if method == "GET" and path == "/v1/me/player/devices":
+                return 200, {"devices": [dict(BENCH_DEVICE, volume_percent=self.volume)]}, {}
+            if method == "PUT" and path == "/v1/me/player/volume":
+                if self._faults:
+                    status, retry_after = self._faults.popleft()
+                    headers = {"Retry-After": str(retry_after)} if status == 429 else {}
+                    return status, {"error": {"status": status, "message": "Injected by the benchmark"}}, headers
+                self.volume = int(query.get("volume_percent", [self.volume])[0])
+                return 204, None, {}
+        return 404, {"error": {"status": 404, "message": "Not found"}}, {}
+
+
+class FakeSessionVolume:
+    """Stands in for pycaw's ISimpleAudioVolume"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.level = 0.5
+        self.calls = 0
+
+    def SetMasterVolume(self, level, context):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.level = level
+
+    def GetMasterVolume(self):
+        return self.level
+
+
+class FakeSessionProvider(AudioSessionProvider):
+    """One fake Spotify session next to a few other apps, like a desktop with a browser and a game open"""
+
+    def __init__(self, latency=0.0):
+        self.spotify = FakeSessionVolume(latency)
+        self.sessions = [(1000, "chrome.exe", FakeSessionVolume()), (2000, "Spotify.exe", self.spotify),
+                         (3000, "game.exe", FakeSessionVolume())]
+
+    def enumerate(self):
+        return list(self.sessions)
+
+    def is_running(self, pid):
+        return True
+
+
+@contextmanager
+def bench_environment(server):
+    #Point the core at the stand-in server and keep everything it saves in a throwaway directory
+    saved = core.API_BASE_URL, core.TOKEN_URL
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="spotivol-bench-") as workdir:
+        os.chdir(workdir)
+        core.API_BASE_URL, core.TOKEN_URL = f"{server.url}/v1", f"{server.url}/api/token"
+        try:
+            yield workdir
+        finally:
+            PERSISTENCE.flush()
+            core.API_BASE_URL, core.TOKEN_URL = saved
+            os.chdir(cwd)
+
+
+class ThreadSampler:
+    """Samples threading.active_count() in the background to catch the peak during a scenario"""
+
+    def __init__(self):
+        self.baseline = threading.active_count()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="thread-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(THREAD_SAMPLE_INTERVAL):
+            # The sampler itself doesn't count
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        return {"before": self.baseline, "peak": self.peak, "after": threading.active_count()}
+
+
+class Bench:
+    """Runs scenarios against a fresh controller each, so their numbers don't mix"""
+
+    def __init__(self, presses=DEFAULT_PRESSES, latency=0.0, local_latency=0.0, fault_every=10):
+        self.presses = presses
+        self.latency = latency
+        self.local_latency = local_latency
+        self.fault_every = fault_every
+        self.scenarios = {
+            "local-burst": lambda: self._run(MODE_LOCAL, paced=False),
+            "local-paced": lambda: self._run(MODE_LOCAL, paced=True),
+            "api-burst": lambda: self._run(MODE_API, paced=False),
+            "api-paced": lambda: self._run(MODE_API, paced=True),
+            "api-faults": lambda: self._run(MODE_API, paced=True, faults=True),
+        }
+
+    def run(self, names=None):
+        return {name: self.scenarios[name]() for name in (names or self.scenarios)}
+
+    def _controller(self, server, mode, results):
+        auth = SpotifyAuth()
+        auth.client_id, auth.client_secret = "bench-client", "bench-secret"
+        auth.access_token, auth.refresh_token = server.access_token, "bench-refresh"
+        auth.expires_at = time.time() + BENCH_ACCESS_TOKEN_LIFETIME
+        # The real budget would make this a benchmark of the rate limiter, the faults scenario covers 429s
+        auth.api_client.limiter = RateLimiter(rate=1e6, capacity=1e6)
+
+        def on_status(ok, message):
+            results[ok] += 1
+
+        return VolumeController(auth, on_status=on_status, local_available=mode == MODE_LOCAL, mode=mode,
+                                local_provider=FakeSessionProvider(self.local_latency))
+
+    def _run(self, mode, paced, faults=False):
+        server = FakeSpotifyServer(self.latency if mode == MODE_API else 0.0).start()
+        results = Counter()
+        faults_sent = Counter()
+        controller = None
+        try:
+            with bench_environment(server), ThreadSampler() as threads:
+                controller = self._controller(server, mode, results)
+                backend = "local" if mode == MODE_LOCAL else "api"
+                fire = [controller.prepare(volume) for volume in range(101)]
+                started = time.perf_counter()
+                for i in range(self.presses):
+                    if faults and i and i % self.fault_every == 0:
+                        status = (429, 503, 401)[(i // self.fault_every) % 3]
+                        server.inject(status)
+                        faults_sent[status] += 1
+                    fire[i % 101]()
+                    if paced:
+                        controller.wait_idle(30)
+                controller.wait_idle(60)
+                elapsed = time.perf_counter() - started
+                auth = controller.auth
+                auth.cancel_scheduled_refresh()
+                stats = controller.dispatch_stats()[backend]
+                latency = controller.latency.summary().get(backend, {})
+        finally:
+            # Before the thread summary below, so "after" shows whether the scenario left threads behind
+            if controller is not None:
+                controller.close()
+            server.stop()
+
+        report = {
+            "mode": mode,
+            "presses": self.presses,
+            "seconds": round(elapsed, 3),
+            "presses_per_s": round(self.presses / elapsed, 1),
+            "applied_per_s": round(stats["executed"] / elapsed, 1),
+            "dispatch": stats,
+            "results": {"ok": results[True], "failed": results[False], "waiting": results[None]},
+            "latency_ms": {stage: latency[stage] for stage in ("total", "call", "token", "dispatch")
+                           if stage in latency},
+            "threads": threads.summary(),
+        }
+        if mode == MODE_API:
+            report["server"] = {f"{route} {status}": count for (route, status), count in sorted(server.requests.items())}
+            report["token_refreshes"] = server.token_requests
+            report["faults_injected"] = {str(status): count for status, count in faults_sent.items()}
+            report["health"] = controller.health["api"].snapshot()["state"]
+        return report
+
+
+def format_report(results):
+    lines = []
+    for name, report in results.items():
+        lines.append(f"{name}  ({report['mode']}, {report['presses']} presses in {report['seconds']} s)")
+        lines.append(f"  throughput  {report['presses_per_s']} presses/s, {report['applied_per_s']} applied/s, "
+                     f"{report['dispatch']['coalesced']} coalesced")
+        lines.append(f"  results     {report['results']['ok']} ok, {report['results']['failed']} failed")
+        for stage, values in report["latency_ms"].items():
+            percentiles = "  ".join(f"p{p} {values[f'p{p}']:.2f}" for p in LATENCY_PERCENTILES)
+            lines.append(f"  {stage:<11} {percentiles} ms  (n={values['count']})")
+        threads = report["threads"]
+        lines.append(f"  threads     {threads['before']} before, {threads['peak']} peak, {threads['after']} after")
+        if "server" in report:
+            lines.append(f"  tokens      {report['token_refreshes']} refreshes, circuit {report['health']}")
+            if report["faults_injected"]:
+                injected = ", ".join(f"{count}x {status}" for status, count in report["faults_injected"].items())
+                lines.append(f"  faults      {injected}")
+            for route, count in report["server"].items():
+                lines.append(f"  server      {route}: {count}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regressions against a saved run: p95 total latency up or throughput down by more than tolerance"""
+    regressions = []
+    for name, report in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        new_p95 = report["latency_ms"].get("total", {}).get("p95")
+        old_p95 = old["latency_ms"].get("total", {}).get("p95")
+        if new_p95 is not None and old_p95 and new_p95 > old_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 latency {old_p95:.2f} -> {new_p95:.2f} ms")
+        if report["presses_per_s"] < old["presses_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {old['presses_per_s']} -> {report['presses_per_s']} presses/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SpotiVol's volume path against a fake Spotify.")
+    parser.add_argument("--scenario", action="append", help="run only this scenario (can be repeated)")
+    parser.add_argument("--presses", type=int, default=DEFAULT_PRESSES, help="presses per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake Spotify takes to answer")
+    parser.add_argument("--local-latency", type=float, default=0.0, help="seconds a fake session volume call takes")
+    parser.add_argument("--fault-every", type=int, default=10, help="inject a 429, 503 or 401 every N presses")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--save", metavar="FILE", help="write the results to FILE as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a saved baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed change against the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    bench = Bench(args.presses, args.latency, args.local_latency, args.fault_every)
+    unknown = [name for name in args.scenario or [] if name not in bench.scenarios]
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(unknown)}, choose from {', '.join(bench.scenarios)}")
+    results = bench.run(args.scenario)
+    print(json.dumps(results, indent=2) if args.json else format_report(results))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"✗ {regression}")
+        if regressions:
+            return 1
+        print("✓ No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
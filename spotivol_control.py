@@ -0,0 +1,247 @@
+import os
+import json
+import socket
+import tempfile
+import threading
+import selectors
+
+"""
+Local control endpoint so scripts (stream deck, game macros...) can trigger SpotiVol without faking key presses.
+On Linux/macOS it's a Unix domain socket, on Windows a loopback TCP port. Set "control_endpoint" in
+spotify_settings.json to "unix:/some/path", "tcp:127.0.0.1:8889" or "off" to change it.
+
+Protocol: one UTF-8 line per request, one line back per request.
+    apply <n|name>   apply profile n (1-based) or the profile with that name
+    set <0-100>      set an absolute volume
+    set +5 / set -5  step the volume relative to the current one (steps queued back to back add up)
+    state            current mode, volume, device, dispatcher stats and backend health as JSON
+    ping
+Answers start with "ok " or "err ". Commands are queued and answered right away, they don't wait for Spotify.
+"""
+
+DEFAULT_CONTROL_PORT = 8889
+CONTROL_SOCKET_NAME = "spotivol.sock"
+MAX_REQUEST_LINE = 256
+
+
+def default_endpoint():
+    if hasattr(socket, "AF_UNIX") and os.name != "nt":
+        runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        return f"unix:{os.path.join(runtime_dir, CONTROL_SOCKET_NAME)}"
+    return f"tcp:127.0.0.1:{DEFAULT_CONTROL_PORT}"
+
+
+def parse_endpoint(endpoint):
+    """Turn "unix:/path" or "tcp:host:port" into (family, address). None means the endpoint is switched off."""
+    endpoint = endpoint or default_endpoint()
+    if endpoint == "off":
+        return None
+    kind, _, rest = endpoint.partition(":")
+    if kind == "unix":
+        return socket.AF_UNIX, rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(f"Unknown control endpoint: {endpoint}")
+
+
+def control_request(line, endpoint=None, timeout=2.0):
+    """Send one request to a running SpotiVol and return its answer line"""
+    family, address = parse_endpoint(endpoint)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(line.strip().encode() + b"\n")
+        answer = b""
+        while not answer.endswith(b"\n"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            answer += chunk
+    return answer.decode().strip()
+
+
+def endpoint_in_use(path):
+    """True if something is listening on the Unix socket at path. A socket file nobody answers on (refused, or not
+    a socket at all) is left over from a run that didn't get to clean up."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1.0)
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        except OSError as e:
+            # ENOTSOCK and the like: not a live endpoint either. Timeouts mean a busy server, leave it alone.
+            return isinstance(e, socket.timeout)
+    return True
+
+
+class ControlServer:
+    """Serves the control protocol on one thread with a selector, so requests never start threads of their own"""
+
+    def __init__(self, controller, get_profiles, endpoint=None):
+        self.controller = controller
+        self.get_profiles = get_profiles
+        self.endpoint = endpoint
+        self.address = None
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._thread = None
+        self._running = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+
+    def start(self):
+        """Open the endpoint and start serving. Returns (ok, message)."""
+        try:
+            parsed = parse_endpoint(self.endpoint)
+            if parsed is None:
+                return False, "Control endpoint is switched off"
+            family, address = parsed
+            if family == socket.AF_UNIX and os.path.exists(address):
+                if endpoint_in_use(address):
+                    return False, f"Control endpoint not started: {address} is in use by another SpotiVol"
+                os.remove(address)  # left over from a previous run
+            listener = socket.socket(family, socket.SOCK_STREAM)
+            if family != socket.AF_UNIX:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(address)
+            listener.listen(8)
+            listener.setblocking(False)
+        except Exception as e:
+            return False, f"Control endpoint not started: {e}"
+
+        self._listener = listener
+        self.address = address
+        self._selector.register(listener, selectors.EVENT_READ, None)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, "wakeup")
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="control-server", daemon=True)
+        self._thread.start()
+        return True, f"Control endpoint listening on {address}"
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup_w.send(b"x")
+        self._thread.join(2)
+
+    def _serve(self):
+        try:
+            while self._running:
+                for key, events in self._selector.select():
+                    if key.data == "wakeup":
+                        continue
+                    if key.data is None:
+                        self._accept()
+                    else:
+                        self._service(key, events)
+        finally:
+            for key in list(self._selector.get_map().values()):
+                if key.data not in (None, "wakeup"):
+                    key.fileobj.close()
+            self._selector.close()
+            self._listener.close()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.remove(self.address)
+
+    def _accept(self):
+        try:
+            conn, _ = self._listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        conn.setblocking(False)
+        self._selector.register(conn, selectors.EVENT_READ, {"in": b"", "out": b""})
+
+    def _close(self, conn):
+        self._selector.unregister(conn)
+        conn.close()
+
+    def _service(self, key, events):
+        conn, buffers = key.fileobj, key.data
+        if events & selectors.EVENT_READ:
+            try:
+                data = conn.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                data = None
+            except OSError:
+                data = b""
+            if data == b"":
+                self._close(conn)
+                return
+            if data:
+                buffers["in"] += data
+                while b"\n" in buffers["in"]:
+                    line, buffers["in"] = buffers["in"].split(b"\n", 1)
+                    buffers["out"] += self.handle(line.decode(errors="replace")).encode() + b"\n"
+                if len(buffers["in"]) > MAX_REQUEST_LINE:
+                    self._close(conn)
+                    return
+        if buffers["out"]:
+            try:
+                sent = conn.send(buffers["out"])
+                buffers["out"] = buffers["out"][sent:]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                self._close(conn)
+                return
+        wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if buffers["out"] else 0)
+        if wanted != key.events:
+            self._selector.modify(conn, wanted, buffers)
+
+    def handle(self, line):
+        """Run one request line and return the answer line"""
+        parts = line.strip().split()
+        if not parts:
+            return "err empty request"
+        command, args = parts[0].lower(), parts[1:]
+        try:
+            if command == "ping":
+                return "ok pong"
+            if command == "state":
+                return "ok " + json.dumps(self.state())
+            if command == "apply" and args:
+                return self._apply_profile(" ".join(args))
+            if command == "set" and len(args) == 1:
+                return self._set_volume(args[0])
+        except Exception as e:
+            return f"err {e}"
+        return f"err unknown request: {line.strip()[:40]}"
+
+    def _apply_profile(self, arg):
+        profiles = self.get_profiles()
+        if arg.isdigit():
+            index = int(arg) - 1
+        else:
+            names = [str(cfg.get("name", "")).lower() for cfg in profiles]
+            index = names.index(arg.lower()) if arg.lower() in names else -1
+        if not 0 <= index < len(profiles):
+            return f"err no profile {arg}"
+        cfg = profiles[index]
+        if cfg.get("step"):
+            self.controller.step_volume(int(cfg["step"]), float(cfg.get("fade", 0.0)),
+                                        cfg.get("curve", "Linear"), cfg.get("device", ""))
+            return f"ok profile {arg} queued ({int(cfg['step']):+d}%)"
+        self.controller.apply_volume(int(cfg.get("volume", 50)), float(cfg.get("fade", 0.0)),
+                                     cfg.get("curve", "Linear"), cfg.get("device", ""))
+        return f"ok profile {arg} queued ({cfg.get('volume', 50)}%)"
+
+    def _set_volume(self, arg):
+        volume = int(arg)
+        if arg[0] in "+-":
+            self.controller.step_volume(volume)
+            return f"ok step {volume:+d} queued"
+        volume = max(0, min(100, volume))
+        self.controller.apply_volume(volume)
+        return f"ok {volume}% queued"
+
+    def state(self):
+        playback = self.controller.playback
+        return {
+            "mode": self.controller.mode,
+            "volume": self.controller.current_volume(),
+            "device": playback.device_name,
+            "stats": self.controller.dispatch_stats(),
+            "health": self.controller.health_stats(),
+        }
@@ -0,0 +1,2159 @@
+import asyncio
+import threading
+import requests
+import traceback
+import json
+import os
+import sys
+import time
+import random
+import atexit
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from spotivol_io import IO_ENGINE, AsyncHttpClient, OAuthCallbackListener
+
+"""
+Everything SpotiVol needs to turn "set volume to X" into a Spotify call, without any GUI code.
+spotify_vol_controller.py (the PyQt5 window) and spotivol_headless.py (the background service) both build on this,
+so this module must never import PyQt5.
+importing requests lets us build the HTTP requests for API usage, spotivol_io sends them on its asyncio loop and
+keeps a pool of open connections.
+importing time lets us track when the access token expires, time volume fades and pace API calls.
+random adds jitter to retry delays so retries from several presses or accounts don't line up.
+atexit and tempfile let settings, tokens and profiles be written in the background and atomically.
+deque and contextmanager keep the rolling latency samples and time each stage of a volume change.
+urllib.parse builds the login link. The local server that receives Spotify's answer lives in spotivol_io.
+"""
+
+
+# Volume control modes, mapped to the dispatcher(s) they use
+MODE_LOCAL = "Local (Windows, pycaw)"
+MODE_LOCAL_PULSE = "Local (Linux, PulseAudio/PipeWire)"
+MODE_API = "Spotify Web API"
+MODE_HEDGED = "Hedged (Local + Web API)"
+MODE_BACKENDS = {
+    MODE_LOCAL: ("local",),
+    MODE_LOCAL_PULSE: ("local",),
+    MODE_API: ("api",),
+    MODE_HEDGED: ("local", "api"),
+}
+
+# Which sound system each Local mode talks to. Only this platform's Local mode is offered, a Local mode saved on the
+# other platform runs as this one's (see platform_mode()). Hedged mode uses the one this platform has.
+LOCAL_MODE_BACKENDS = {
+    MODE_LOCAL: "pycaw",
+    MODE_LOCAL_PULSE: "pulse",
+}
+PULSE_CLIENT_NAME = "SpotiVol"
+
+# Spotify OAuth Configuration
+REDIRECT_URI = "http://127.0.0.1:8888/callback"
+SCOPE = "user-modify-playback-state user-read-playback-state"
+TOKEN_FILE = "spotify_tokens.json"
+ACCOUNT_TOKEN_FILE = "spotify_tokens.{name}.json"  # tokens of the extra accounts listed under "accounts" in settings
+SETTINGS_FILE = "spotify_settings.json"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+API_BASE_URL = "https://api.spotify.com/v1"
+#Part above is essential for Spotify API usage. That's how we use the things we gain from API.
+
+# Saves are written this long after the last change, so a burst of changes is one write
+PERSIST_DELAY = 0.5
+
+# Connection pool defaults, can be overridden with "http_pool_size", "http_connect_timeout"
+# and "http_read_timeout" in spotify_settings.json
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 8
+
+# Connections to the Web API are opened at startup and after login, then touched every KEEPALIVE_INTERVAL seconds
+# ("keepalive_interval" in spotify_settings.json, 0 switches it off), so the first press after a long idle doesn't
+# pay for DNS, TCP and TLS. Keep-alives are unauthenticated HEADs and don't count against the rate limit.
+WARM_CONNECTIONS = 2
+KEEPALIVE_INTERVAL = 45
+
+# Refresh the access token this many seconds before Spotify expires it
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_REFRESH_RETRY = 60
+
+# Spotify doesn't publish its exact limit (it's a rolling 30 second window), so we stay conservative
+API_RATE_WINDOW = 30
+API_RATE_LIMIT = 90
+API_RATE_BURST = 10
+API_MAX_RATE_LIMIT_RETRIES = 3
+PREPARED_CACHE_SIZE = 256
+
+# Backend health. After CIRCUIT_FAILURES failures in a row a backend's circuit opens: Web API calls fail at once
+# for CIRCUIT_OPEN_SECONDS, then one trial call decides whether it closes again. Timeouts follow the observed p99
+# latency (times ADAPTIVE_TIMEOUT_FACTOR, never below ADAPTIVE_TIMEOUT_MIN) once there are enough samples.
+CIRCUIT_FAILURES = 3
+CIRCUIT_OPEN_SECONDS = 15
+HEALTH_WINDOW = 100
+ADAPTIVE_TIMEOUT_SAMPLES = 10
+ADAPTIVE_TIMEOUT_FACTOR = 3
+ADAPTIVE_TIMEOUT_MIN = 1.0
+API_MAX_RETRIES = 2
+NOT_LOGGED_IN_MESSAGE = "Not logged in. Click 'Login to Spotify' first."
+RETRY_BASE_DELAY = 0.25
+
+# Playback state is polled slowly, our own writes keep it up to date in between
+PLAYBACK_POLL_INTERVAL = 15
+PLAYBACK_STATE_TTL = 20
+DEVICE_INDEX_TTL = 300
+
+# VolumeController.close() gives a command that's already talking to a backend this many seconds to finish
+CLOSE_TIMEOUT = 2
+
+# Fade settings. Local steps are cheap, Web API steps are limited by latency and the rate budget.
+FADE_CURVES = {
+    "Linear": lambda t: t,
+    "Ease in": lambda t: t * t,
+    "Ease out": lambda t: 1 - (1 - t) * (1 - t),
+    "Ease in-out": lambda t: t * t * (3 - 2 * t),
+}
+LOCAL_FADE_INTERVAL = 0.02
+API_FADE_MIN_INTERVAL = 0.15
+API_FADE_BUDGET_SHARE = 0.5
+
+# Latency instrumentation: how many recent samples each percentile is computed over, and the stages of a
+# volume change in the order they happen ("call" is the HTTP request or the COM call)
+LATENCY_WINDOW = 500
+LATENCY_STAGES = ("hook", "dispatch", "token", "throttle", "call", "status", "total")
+LATENCY_PERCENTILES = (50, 95, 99)
+
+# Status line: at most this many redraws a second, however many results come in
+STATUS_MAX_FPS = 30
+
+# Hotkey traces for the soak harness (spotivol_soak.py), recorded when "record_trace" in spotify_settings.json
+# names a file. Only the newest TRACE_MAX_EVENTS presses are kept.
+TRACE_MAX_EVENTS = 200000
+
+# Profiles (volume, fade, device, hotkey) and the selected mode, shared by the GUI and headless mode
+PROFILES_FILE = "spotify_profiles.json"
+PROFILE_DEFAULTS = {
+    "name": "",
+    "volume": 50,
+    "fade": 0.0,
+    "curve": "Linear",
+    "device": "",
+    "hotkey": "",
+    "bound": False,
+    "step": 0,  # non-zero makes the profile a relative step (e.g. +5 / -5) instead of setting "volume"
+}
+
+
+def _sleep_seconds(seconds):
+    time.sleep(seconds)
+    return False
+
+
+_optional_modules = {}
+
+
+def optional_import(name):
+    """Import an optional module the first time it's needed and remember the outcome. None if it isn't available."""
+    if name not in _optional_modules:
+        try:
+            # Plain __import__ so --profile-startup sees these imports too
+            __import__(name)
+            _optional_modules[name] = sys.modules[name]
+        except Exception:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+
+def local_backend():
+    """The local sound system on this platform: "pycaw" on Windows, "pulse" elsewhere (PulseAudio, or PipeWire
+    through pipewire-pulse)"""
+    return "pycaw" if sys.platform == "win32" else "pulse"
+
+
+def local_mode():
+    """The Local mode this platform runs"""
+    return MODE_LOCAL if local_backend() == "pycaw" else MODE_LOCAL_PULSE
+
+
+def platform_mode(mode):
+    """mode as this platform can run it: the other platform's Local mode becomes this one's, anything else is
+    returned as is"""
+    if mode in LOCAL_MODE_BACKENDS:
+        return local_mode()
+    return mode
+
+
+def local_mode_available():
+    """True if this platform's local backend can be imported: pycaw/comtypes on Windows, pulsectl elsewhere"""
+    if local_backend() == "pycaw":
+        return optional_import("pycaw.pycaw") is not None and optional_import("comtypes") is not None
+    return optional_import("pulsectl") is not None
+
+
+def default_local_provider():
+    return PycawSessionProvider() if local_backend() == "pycaw" else PulseSessionProvider()
+
+
+class WriteBehind:
+    """In-memory copies of the JSON files, written to disk from one background thread.
+    save() returns right away; saves within PERSIST_DELAY of each other become one write, and every write goes to
+    a temp file that is renamed over the real one, so a crash leaves the old file or the new one, never half."""
+
+    def __init__(self, delay=PERSIST_DELAY):
+        self.delay = delay
+        self._cache = {}
+        self._pending = {}
+        self._writing = False
+        self._flush_requested = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.writes = 0
+        self.coalesced = 0
+
+    def load(self, *paths):
+        """Read every path in one go and return their contents, {} for missing or broken files.
+        Files that were saved this session come from memory."""
+        results = []
+        for path in paths:
+            with self._cond:
+                text = self._cache.get(path)
+            if text is None and os.path.exists(path):
+                try:
+                    with open(path, 'r') as f:
+                        text = f.read()
+                except Exception as e:
+                    print(f"Failed to load {path}: {e}")
+            try:
+                data = json.loads(text) if text else {}
+            except ValueError as e:
+                print(f"Failed to load {path}: {e}")
+                data = {}
+            with self._cond:
+                if text is not None:
+                    self._cache.setdefault(path, text)
+            results.append(data)
+        return results
+
+    def save(self, path, data, indent=None):
+        """Remember data as the new contents of path and write it soon"""
+        text = json.dumps(data, indent=indent)  # serialised now, so later changes to data don't leak in
+        self._queue(path, text)
+
+    def delete(self, path):
+        """Remove path, dropping any write still waiting for it"""
+        self._queue(path, "")
+
+    def _queue(self, path, text):
+        with self._cond:
+            if path in self._pending:
+                self.coalesced += 1
+            self._pending[path] = text
+            self._cache[path] = text
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until everything saved so far is on disk"""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._writing = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                self._writing = True
+                # Let a burst of saves settle first, unless someone is waiting in flush()
+                deadline = time.monotonic() + self.delay
+                while not self._flush_requested and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                self._flush_requested = False
+                batch, self._pending = self._pending, {}
+            for path, text in batch.items():
+                try:
+                    self._write(path, text)
+                except Exception as e:
+                    print(f"Failed to save {path}: {e}")
+
+    def _write(self, path, text):
+        if not text:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.writes += 1
+
+
+# One writer for the whole process. Whatever is still waiting gets written when Python exits.
+PERSISTENCE = WriteBehind()
+atexit.register(PERSISTENCE.flush, 5)
+
+
+class ProfileStore:
+    """Any number of profiles plus the selected mode, saved to spotify_profiles.json"""
+
+    def __init__(self, path=PROFILES_FILE):
+        self.path = path
+        self.mode = None
+        self.profiles = []
+        self.load()
+
+    def load(self):
+        data, = PERSISTENCE.load(self.path)
+        self.mode = data.get('mode')
+        self.profiles = []
+        for cfg in data.get('profiles', []):
+            self.add(cfg)
+        if not self.profiles:
+            # Fresh install starts with two empty profiles, like the app always had
+            self.add()
+            self.add()
+
+    def save(self):
+        PERSISTENCE.save(self.path, {'mode': self.mode, 'profiles': self.profiles}, indent=2)
+
+    def add(self, cfg=None):
+        """Append a profile, filling in defaults. Returns the stored profile."""
+        cfg = dict(cfg or {})
+        profile = {**PROFILE_DEFAULTS, **cfg}
+        if not profile["name"]:
+            profile["name"] = f"Profile {len(self.profiles) + 1}"
+        if "bound" not in cfg:
+            # Files saved before profiles remembered their binding: a profile with a hotkey was meant to be bound
+            profile["bound"] = bool(profile["hotkey"])
+        self.profiles.append(profile)
+        return profile
+
+    def remove(self, index):
+        del self.profiles[index]
+
+    def bound_profiles(self):
+        return [p for p in self.profiles if p["bound"] and p["hotkey"]]
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while a backend's circuit is open"""
+
+
+class BackendHealth:
+    """Success/failure and latency history of one backend, with a circuit breaker on top"""
+
+    def __init__(self, name, max_timeout, window=HEALTH_WINDOW):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.latencies = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.total_failures = 0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at < CIRCUIT_OPEN_SECONDS:
+            return "open"
+        return "half-open"
+
+    def healthy(self):
+        return self.state == "closed"
+
+    def allow(self):
+        """True if a call may go out now. While half-open only one trial call is let through at a time."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, ok, seconds=None):
+        with self._lock:
+            self.trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                if seconds is not None:
+                    self.latencies.append(seconds)
+                return
+            self.failures += 1
+            self.total_failures += 1
+            if self.failures >= CIRCUIT_FAILURES or self.opened_at is not None:
+                # A failed trial call opens it again for another full period
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+
+    def timeout(self):
+        """Read timeout for the next call, from the p99 of recent successful calls"""
+        if self.max_timeout is None:
+            return None  # not a network backend
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < ADAPTIVE_TIMEOUT_SAMPLES:
+            return self.max_timeout
+        p99 = samples[min(len(samples) - 1, round(0.99 * len(samples)) - 1)]
+        return min(self.max_timeout, max(ADAPTIVE_TIMEOUT_MIN, p99 * ADAPTIVE_TIMEOUT_FACTOR))
+
+    def snapshot(self):
+        return {"state": self.state, "failures": self.failures, "total_failures": self.total_failures,
+                "trips": self.trips, "timeout": self.timeout() and round(self.timeout(), 2)}
+
+
+class RateLimiter:
+    """Token bucket in front of Web API calls that also honors Spotify's Retry-After"""
+
+    def __init__(self, rate=API_RATE_LIMIT / API_RATE_WINDOW, capacity=API_RATE_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take a token. Returns 0 if the call may go now, otherwise how many seconds to wait before asking again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def throttle(self, seconds):
+        """Spotify answered 429, hold every call until Retry-After has passed"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.throttled_count += 1
+
+    def retry_after(self):
+        """Seconds left on the current Retry-After, 0 if not throttled"""
+        with self._lock:
+            return max(0.0, self.blocked_until - time.monotonic())
+
+    def budget(self, seconds):
+        """How many calls can be made over the next few seconds without waiting"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return 0
+            self._refill(now)
+            return int(self.tokens + self.rate * seconds)
+
+
+class SpotifyApiClient:
+    """Shared, thread-safe HTTP client that keeps connections to Spotify open.
+    Requests are sent on the I/O engine's loop, the blocking methods wait for them from the calling thread."""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, engine=None):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.engine = engine or IO_ENGINE
+        # One pool per host (accounts + api), each holding up to pool_size keep-alive connections
+        self.http = AsyncHttpClient(pool_size, connect_timeout, read_timeout)
+        self._lock = threading.Lock()
+        self._prepared = {}
+        self.limiter = RateLimiter()
+        self.health = BackendHealth("api", read_timeout)
+        self.latency = None
+        self.warmups = 0
+        self._keepalive = None
+        #A new TCP+TLS handshake costs more than the volume request itself, so every call goes through the same
+        #pool instead of opening a connection of its own.
+
+    def _send(self, prepared):
+        return self.engine.call(self.send_async(prepared))
+
+    async def send_async(self, prepared):
+        """Send a prepared request on the loop, without going through the rate limiter.
+        Raises CircuitOpenError without sending anything while the Web API is marked unhealthy."""
+        if not self.health.allow():
+            raise CircuitOpenError("Spotify Web API is unreachable, not trying again for a few seconds")
+        started = time.perf_counter()
+        try:
+            r = await self.http.request(prepared.method, prepared.url, prepared.headers, prepared.body,
+                                        timeout=self.health.timeout())
+        except Exception:
+            self.health.record(False)
+            raise
+        elapsed = time.perf_counter() - started
+        # Spotify's own 5xx count against its health, 4xx are our problem (token, device, rate limit)
+        self.health.record(r.status_code < 500, elapsed)
+        with self._lock:
+            # Smoothed request latency, used to size fade steps
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        if r.status_code == 429:
+            try:
+                retry_after = float(r.headers.get("Retry-After", 1))
+            except ValueError:
+                retry_after = 1.0
+            self.limiter.throttle(retry_after)
+        return r
+
+    def warm_up(self):
+        """Open the pooled Web API connections in the background. Returns a future with how many are open."""
+        with self._lock:
+            self.warmups += 1
+        return self.engine.submit(self.http.warm(f"{API_BASE_URL}/me/player", WARM_CONNECTIONS))
+
+    def start_keepalive(self, interval=KEEPALIVE_INTERVAL, active=None):
+        """Warm the pool again every interval seconds, skipping rounds while active() is False"""
+        with self._lock:
+            if self._keepalive is not None or not interval:
+                return
+            self._keepalive = self.engine.submit(self._keepalive_loop(float(interval), active or (lambda: True)))
+
+    def stop_keepalive(self):
+        with self._lock:
+            if self._keepalive is not None:
+                self._keepalive.cancel()
+                self._keepalive = None
+
+    async def _keepalive_loop(self, interval, active):
+        while True:
+            await asyncio.sleep(interval)
+            if active():
+                with self._lock:
+                    self.warmups += 1
+                await self.http.warm(f"{API_BASE_URL}/me/player", WARM_CONNECTIONS)
+
+    def acquire(self, wait=None):
+        """Block until the rate limiter lets one call through. wait(seconds) is used to sleep and may return True
+        to give up, then False is returned."""
+        wait = wait or _sleep_seconds
+        while True:
+            delay = self.limiter.acquire()
+            if delay <= 0:
+                return True
+            if wait(delay):
+                return False
+
+    def send_api(self, prepared, wait=None):
+        """Send a Web API request once the rate limiter lets it through. None if wait gave up."""
+        if not self.acquire(wait):
+            return None
+        return self._send(prepared)
+
+    def send_many_api(self, prepared_list, wait=None):
+        """Send several Web API requests at the same time over the pool, once the limiter allows all of them.
+        Returns a response or exception per request in the same order, None if wait gave up."""
+        for _ in prepared_list:
+            if not self.acquire(wait):
+                return None
+        return self.engine.call(self._gather(prepared_list))
+
+    async def _gather(self, prepared_list):
+        return await asyncio.gather(*(self.send_async(p) for p in prepared_list), return_exceptions=True)
+
+    def post_token(self, data):
+        """POST to the Spotify token endpoint over the pooled connections"""
+        return self.engine.call(self.post_token_async(data))
+
+    async def post_token_async(self, data):
+        return await self.http.request("POST", TOKEN_URL,
+                                       {"Content-Type": "application/x-www-form-urlencoded"}, urlencode(data))
+
+    def prepare_volume(self, access_token, percent, device_id=None):
+        """Return a ready-to-send volume request, built once per token, volume and device"""
+        with self._lock:
+            if len(self._prepared) >= PREPARED_CACHE_SIZE:
+                self._prepared.clear()  # mostly requests for tokens that have been refreshed since
+            key = (access_token, percent, device_id)
+            prepared = self._prepared.get(key)
+            if prepared is None:
+                params = {"volume_percent": percent}
+                if device_id:
+                    params["device_id"] = device_id
+                request = requests.Request(
+                    "PUT", f"{API_BASE_URL}/me/player/volume",
+                    headers={"Authorization": f"Bearer {access_token}"},
+                    params=params,
+                )
+                prepared = request.prepare()
+                self._prepared[key] = prepared
+            return prepared.copy()
+
+    def get_player(self, access_token, wait=None):
+        """GET /me/player (current device, volume and playback)"""
+        request = requests.Request("GET", f"{API_BASE_URL}/me/player",
+                                   headers={"Authorization": f"Bearer {access_token}"})
+        return self.send_api(request.prepare(), wait)
+
+    def get_devices(self, access_token, wait=None):
+        """GET /me/player/devices (every Spotify Connect device on the account)"""
+        request = requests.Request("GET", f"{API_BASE_URL}/me/player/devices",
+                                   headers={"Authorization": f"Bearer {access_token}"})
+        return self.send_api(request.prepare(), wait)
+
+    def put_volume(self, access_token, percent, device_id=None, wait=None):
+        """Send the volume PUT on a pooled connection"""
+        return self.send_api(self.prepare_volume(access_token, percent, device_id), wait)
+
+    def close(self):
+        self.stop_keepalive()
+        self.engine.call(self.http.close())
+
+
+class SpotifyAuth:
+    """Handles Spotify OAuth authentication and token management for one account.
+    The main account has name "", extra accounts keep their tokens in their own file and share the main account's
+    api_client, so every account goes through the same connection pool and rate limiter."""
+
+    def __init__(self, name="", api_client=None):
+        self.name = name
+        self.token_file = ACCOUNT_TOKEN_FILE.format(name=name) if name else TOKEN_FILE
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None
+        self.client_id = None
+        self.client_secret = None
+        self.extra_settings = {}
+        self._refresh_lock = threading.Lock()
+        self._refresh_flight = None
+        self._refresh_timer = None  # a future on the I/O loop, cancel() stops it
+        # Settings and tokens are read in one pass, later saves only touch memory and queue a background write
+        settings, tokens = PERSISTENCE.load(SETTINGS_FILE, self.token_file)
+        self._apply_settings(settings)
+        self._apply_tokens(tokens)
+        self.api_client = api_client or SpotifyApiClient(
+            pool_size=self.extra_settings.get('http_pool_size', DEFAULT_POOL_SIZE),
+            connect_timeout=self.extra_settings.get('http_connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+            read_timeout=self.extra_settings.get('http_read_timeout', DEFAULT_READ_TIMEOUT),
+        )
+        self.schedule_refresh()
+
+    def load_settings(self):
+        """This part loads Client ID and Secret from file"""
+        self._apply_settings(PERSISTENCE.load(SETTINGS_FILE)[0])
+
+    def _apply_settings(self, data):
+        self.client_id = data.get('client_id')
+        self.client_secret = data.get('client_secret')
+        # Everything else (http_*, control_endpoint, ...) is kept as-is and written back on save
+        self.extra_settings = {k: v for k, v in data.items() if k not in ('client_id', 'client_secret')}
+
+    def save_settings(self):
+        """Save Client ID and Secret to file"""
+        PERSISTENCE.save(SETTINGS_FILE, {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            **self.extra_settings
+        })
+
+    def load_tokens(self):
+        """Load saved tokens from file"""
+        self._apply_tokens(PERSISTENCE.load(self.token_file)[0])
+
+    def _apply_tokens(self, data):
+        self.access_token = data.get('access_token')
+        self.refresh_token = data.get('refresh_token')
+        self.expires_at = data.get('expires_at')
+
+    def save_tokens(self):
+        """Save tokens to file, in the background so a refresh on the hotkey path never waits on the disk"""
+        PERSISTENCE.save(self.token_file, {
+            'access_token': self.access_token,
+            'refresh_token': self.refresh_token,
+            'expires_at': self.expires_at
+        })
+
+    def forget_tokens(self):
+        """Drop the tokens in memory and on disk (logout)"""
+        self.cancel_scheduled_refresh()
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None
+        PERSISTENCE.delete(self.token_file)
+
+    @property
+    def label(self):
+        return self.name or "main"
+
+    def extra_accounts(self):
+        """The extra accounts listed under "accounts" in spotify_settings.json, sharing this one's connections"""
+        accounts = []
+        for name in self.extra_settings.get('accounts', []):
+            if not isinstance(name, str) or not valid_account_name(name):
+                print(f"Skipping account {name!r}: use only letters, digits, spaces, - and _")
+                continue
+            accounts.append(SpotifyAuth(name, api_client=self.api_client))
+        return accounts
+
+    def get_auth_url(self):
+        """Generate Spotify authorization URL"""
+        params = {
+            'client_id': self.client_id,
+            'response_type': 'code',
+            'redirect_uri': REDIRECT_URI,
+            'scope': SCOPE,
+        }
+        if self.name:
+            # Spotify skips straight back for a user who already approved the app, so an extra account would get the
+            # tokens of whoever is signed in to the browser. The dialog lets them switch accounts first.
+            params['show_dialog'] = 'true'
+        return f"https://accounts.spotify.com/authorize?{urlencode(params)}"
+        #part above gives the specific link (spotify API source) to user so they can get Client ID and Client Secret.
+
+    def start_login(self, timeout=120):
+        """Start listening for Spotify's redirect on the I/O loop. Returns a future that resolves to (ok, message)
+        once the browser comes back (or timeout passes). Raises OSError if the callback port is taken."""
+        engine = self.api_client.engine
+        listener = OAuthCallbackListener(REDIRECT_URI)
+        engine.call(listener.start())
+        return engine.submit(self._complete_login(listener, timeout))
+
+    async def _complete_login(self, listener, timeout):
+        code = await listener.wait(timeout)
+        if not code:
+            return False, "No authorization code received"
+        return await self._exchange_code(code)
+
+    def exchange_code(self, code):
+        return self.api_client.engine.call(self._exchange_code(code))
+
+    async def _exchange_code(self, code):
+        #This part gets access_tokens and refresh_Tokens. With access_tokens app serves the user and with refresh_tokens
+        #app gets fresh access_tokens. Access_tokens are active for an hour so it's a necessary part for app to work.
+        try:
+            data = {
+                'grant_type': 'authorization_code',
+                'code': code,
+                'redirect_uri': REDIRECT_URI,
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+            }
+            r = await self.api_client.post_token_async(data)
+            if r.status_code == 200:
+                tokens = r.json()
+                self.access_token = tokens['access_token']
+                self.refresh_token = tokens.get('refresh_token')
+                self._set_expiry(tokens)
+                self.save_tokens()
+                self.schedule_refresh()
+                return True, "Successfully authenticated!"
+            else:
+                return False, f"Token exchange failed: {r.status_code} - {r.text}"
+        except Exception as e:
+            return False, f"Error exchanging code: {e}"
+
+    def _set_expiry(self, tokens):
+        expires_in = tokens.get('expires_in')
+        self.expires_at = time.time() + expires_in if expires_in else None
+
+    def token_expires_in(self):
+        """Seconds left before the access token expires, None if unknown"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.time()
+
+    def refresh_access_token(self):
+        """Refresh the access token, sharing one in-flight refresh between all callers"""
+        flight = self.refresh_in_background()
+        flight['done'].wait()
+        return flight['result']
+
+    def refresh_in_background(self):
+        """Start a refresh on the I/O loop unless one is already running. Returns the flight to wait on."""
+        with self._refresh_lock:
+            if self._refresh_flight is not None:
+                # Already refreshing, everyone waits for the same answer instead of sending a second request
+                return self._refresh_flight
+            flight = self._refresh_flight = {'done': threading.Event(), 'result': None}
+        self.api_client.engine.submit(self._refresh(flight))
+        return flight
+
+    async def _refresh(self, flight):
+        try:
+            result = await self._request_refresh()
+        except Exception as e:
+            result = False, f"Error refreshing token: {e}"
+        with self._refresh_lock:
+            self._refresh_flight = None
+        flight['result'] = result
+        flight['done'].set()
+        self.schedule_refresh(retry=not result[0])
+
+    async def _request_refresh(self):
+        if not self.refresh_token:
+            return False, "No refresh token available"
+
+        try:
+            data = {
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token,
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+            }
+            r = await self.api_client.post_token_async(data)
+            if r.status_code == 200:
+                tokens = r.json()
+                self.access_token = tokens['access_token']
+                # Refresh token might be updated
+                if 'refresh_token' in tokens:
+                    self.refresh_token = tokens['refresh_token']
+                self._set_expiry(tokens)
+                self.save_tokens()
+                return True, "Token refreshed successfully"
+            else:
+                return False, f"Token refresh failed: {r.status_code}"
+        except Exception as e:
+            return False, f"Error refreshing token: {e}"
+        #Part above refreshes token that user gave and gives feedback about situation of the token since it's essential
+
+    def schedule_refresh(self, retry=False):
+        """Arm a timer that refreshes the access token shortly before it expires"""
+        with self._refresh_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            if not self.refresh_token:
+                return
+            remaining = self.token_expires_in()
+            if retry:
+                delay = TOKEN_REFRESH_RETRY
+            elif remaining is None:
+                # Tokens saved by an older version have no expiry, refresh once to learn it
+                delay = 0
+            else:
+                delay = max(0, remaining - TOKEN_REFRESH_MARGIN)
+            self._refresh_timer = self.api_client.engine.call_later(delay, self.refresh_in_background)
+
+    def cancel_scheduled_refresh(self):
+        with self._refresh_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+
+    def ensure_fresh_token(self):
+        """Called on the hotkey path. Only blocks if the token has already expired."""
+        remaining = self.token_expires_in()
+        if remaining is None or remaining > TOKEN_REFRESH_MARGIN:
+            return True, ""
+        if remaining > 0:
+            # Still valid, let the refresh happen next to the request instead of in front of it
+            self.refresh_in_background()
+            return True, ""
+        # Timer missed the window (e.g. the PC was asleep), join or start the refresh
+        return self.refresh_access_token()
+
+
+class PlaybackState:
+    """Last known Spotify player state: volume, active device and whether it supports volume"""
+
+    def __init__(self, ttl=PLAYBACK_STATE_TTL):
+        self.ttl = ttl
+        self.volume = None
+        self.device_id = None
+        self.device_name = None
+        self.supports_volume = None
+        self.updated = 0.0
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def update_from_player(self, player):
+        """Store a /me/player response. None means Spotify has no active device."""
+        device = (player or {}).get('device') or {}
+        with self._lock:
+            self.device_id = device.get('id')
+            self.device_name = device.get('name')
+            self.supports_volume = device.get('supports_volume') if device else None
+            self.volume = device.get('volume_percent')
+            self.updated = time.monotonic()
+        self._notify()
+
+    def note_volume(self, volume):
+        """Our own write went through, so we know the volume without asking"""
+        with self._lock:
+            changed = volume != self.volume
+            self.volume = volume
+            self.updated = time.monotonic()
+        if changed:
+            self._notify()
+
+    def clear(self):
+        with self._lock:
+            self.volume = self.device_id = self.device_name = self.supports_volume = None
+            self.updated = 0.0
+        self._notify()
+
+    def is_fresh(self):
+        return self.updated and time.monotonic() - self.updated < self.ttl
+
+    def fresh_volume(self):
+        """Current volume if we learned it recently enough to trust it, otherwise None"""
+        with self._lock:
+            return self.volume if self.is_fresh() else None
+
+    def _notify(self):
+        for listener in list(self.listeners):
+            try:
+                listener(self)
+            except Exception:
+                traceback.print_exc()
+
+
+class DeviceIndex:
+    """Spotify Connect devices by name, refreshed when older than the TTL or after an error"""
+
+    def __init__(self, auth, ttl=DEVICE_INDEX_TTL):
+        self.auth = auth
+        self.ttl = ttl
+        self.devices = {}
+        self.updated = 0.0
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        return time.monotonic() - self.updated >= self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self.updated = 0.0
+
+    def refresh(self, wait=None):
+        """Fetch the device list. Returns False if it couldn't be fetched."""
+        token = self.auth.access_token
+        if not token:
+            return False
+        r = self.auth.api_client.get_devices(token, wait)
+        if r is None or r.status_code != 200:
+            return False
+        devices = {d['name'].lower(): d for d in r.json().get('devices', []) if d.get('id') and d.get('name')}
+        with self._lock:
+            self.devices = devices
+            self.updated = time.monotonic()
+        return True
+
+    def resolve(self, name):
+        """Device ID for a device name (case-insensitive), None if unknown"""
+        with self._lock:
+            device = self.devices.get(name.strip().lower())
+            return device['id'] if device else None
+
+    def default_id(self):
+        """The active device, or the only device if there's just one"""
+        with self._lock:
+            for device in self.devices.values():
+                if device.get('is_active'):
+                    return device['id']
+            if len(self.devices) == 1:
+                return next(iter(self.devices.values()))['id']
+            return None
+
+    def names(self):
+        with self._lock:
+            return [d['name'] for d in self.devices.values()]
+
+
+class PlaybackPoller:
+    """Background thread that reads /me/player every few seconds while logged in. Rounds where active() is False
+    are skipped, so nothing is sent while the selected mode doesn't use the Web API."""
+
+    def __init__(self, auth, state, devices=None, interval=PLAYBACK_POLL_INTERVAL, active=None):
+        self.auth = auth
+        self.state = state
+        self.devices = devices
+        self.interval = interval
+        self.active = active or (lambda: True)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="playback-poll", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def poll_once(self):
+        token = self.auth.access_token
+        if not token:
+            return
+        # Never wait for the rate limiter here, a skipped poll is better than delaying a hotkey
+        r = self.auth.api_client.get_player(token, wait=lambda delay: True)
+        if r is None:
+            return
+        if r.status_code == 200:
+            self.state.update_from_player(r.json())
+        elif r.status_code == 204:
+            self.state.update_from_player(None)
+        # Keep the device index warm here so hotkeys rarely have to fetch it themselves
+        if self.devices is not None and self.devices.is_stale():
+            self.devices.refresh(wait=lambda delay: True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.active():
+                    self.poll_once()
+            except CircuitOpenError:
+                pass  # Web API is known to be down, the breaker lets a poll through again later
+            except Exception as e:
+                print(f"Playback poll failed: {e}")
+            self._stop.wait(self.interval)
+
+
+class AudioSessionProvider:
+    """Source of audio sessions for Local mode. Subclass it to plug in another audio system or a fake one."""
+
+    def initialize(self):
+        """Prepare the calling thread, called once before the first enumerate()"""
+
+    def enumerate(self):
+        """Return a list of (pid, process_name, volume) for every audio session with a process.
+        volume must have SetMasterVolume(level, context) and GetMasterVolume()."""
+        raise NotImplementedError
+
+    def is_running(self, pid):
+        raise NotImplementedError
+
+
+class PycawSessionProvider(AudioSessionProvider):
+    """Windows audio sessions through pycaw"""
+
+    def initialize(self):
+        import comtypes
+        # Must be done for pycaw to talk to Windows audio system. It stays initialized for the worker's lifetime,
+        # so the cached volume handles remain valid between presses.
+        comtypes.CoInitialize()
+
+    def enumerate(self):
+        from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
+
+        found = []
+        for session in AudioUtilities.GetAllSessions():
+            proc = session.Process
+            if not proc:
+                continue
+            name = proc.name()
+            if name:
+                found.append((proc.pid, name, session._ctl.QueryInterface(ISimpleAudioVolume)))
+        return found
+
+    def is_running(self, pid):
+        import psutil
+        return psutil.pid_exists(pid)
+
+
+class PulseSinkInputVolume:
+    """One sink input's volume, with the two ISimpleAudioVolume methods LocalVolumeController uses"""
+
+    def __init__(self, provider, info):
+        self.provider = provider
+        self.info = info
+
+    def SetMasterVolume(self, level, context):
+        # All channels to the same level, keeping the channel count the stream has
+        volume = self.info.volume
+        volume.value_flat = level
+        self.provider.pulse.sink_input_volume_set(self.info.index, volume)
+
+    def GetMasterVolume(self):
+        return self.provider.pulse.sink_input_info(self.info.index).volume.value_flat
+
+
+class PulseSessionProvider(AudioSessionProvider):
+    """Sink inputs (playback streams) on the PulseAudio server, or PipeWire's through pipewire-pulse, via pulsectl.
+    The connection is opened once on the local dispatcher thread and kept, so a press is one volume request on an
+    open socket instead of a pactl process. Sessions are keyed by sink input index, not PID."""
+
+    def __init__(self, client_name=PULSE_CLIENT_NAME):
+        self.client_name = client_name
+        self.pulse = None
+        self._pids = {}
+
+    def initialize(self):
+        self._connect()
+
+    def _connect(self):
+        import pulsectl
+        if self.pulse is not None:
+            self.pulse.close()
+        self.pulse = pulsectl.Pulse(self.client_name)
+
+    def enumerate(self):
+        import pulsectl
+
+        try:
+            inputs = self.pulse.sink_input_list()
+        except pulsectl.PulseError:
+            # The sound server went away (restart, user session switch), connect again once
+            self._connect()
+            inputs = self.pulse.sink_input_list()
+        found = []
+        self._pids = {}
+        for info in inputs:
+            props = info.proplist
+            # Both are matched: the binary is "spotify" for the desktop app, but a stream played by another program
+            # (like paplay in the README's test) only says so in application.name
+            names = [props.get("application.process.binary"), props.get("application.name")]
+            name = " ".join(dict.fromkeys(n for n in names if n))
+            pid = props.get("application.process.id")
+            self._pids[info.index] = int(pid) if pid and pid.isdigit() else None
+            if name:
+                found.append((info.index, name, PulseSinkInputVolume(self, info)))
+        return found
+
+    def is_running(self, index):
+        #Cheap check on the process behind the stream. A stream that ended while the process lives on makes the
+        #next volume call fail, and LocalVolumeController enumerates again then.
+        pid = self._pids.get(index)
+        if pid is None:
+            return index in self._pids
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass  # Exists but belongs to someone else
+        return True
+
+
+class LocalVolumeController:
+    """Keeps Spotify's session volume handles cached by PID (sink input on PulseAudio) and only re-enumerates when
+    they go stale"""
+
+    def __init__(self, provider, process_match="spotify"):
+        self.provider = provider
+        self.process_match = process_match
+        self.handles = {}
+        self.enumerations = 0
+        self._initialized = False
+        #Must only be used from one thread (the local dispatcher), COM handles belong to the thread that made them.
+
+    def refresh_sessions(self):
+        """Enumerate sessions and keep the ones that belong to Spotify"""
+        self.enumerations += 1
+        self.handles = {pid: volume for pid, name, volume in self.provider.enumerate()
+                        if self.process_match in name.lower()}
+        return bool(self.handles)
+
+    def _cache_is_valid(self):
+        return bool(self.handles) and all(self.provider.is_running(pid) for pid in self.handles)
+
+    def _apply(self, level):
+        for volume in self.handles.values():
+            volume.SetMasterVolume(level, None)
+
+    def get_volume(self):
+        """Spotify's current session volume in percent, None if it can't be read"""
+        if not self._initialized:
+            self.provider.initialize()
+            self._initialized = True
+        try:
+            if not self._cache_is_valid() and not self.refresh_sessions():
+                return None
+            return round(next(iter(self.handles.values())).GetMasterVolume() * 100)
+        except Exception:
+            self.handles = {}
+            return None
+
+    def set_volume(self, percent: int):
+        if not self._initialized:
+            self.provider.initialize()
+            self._initialized = True
+
+        level = max(0.0, min(1.0, percent / 100.0))
+        try:
+            if not self._cache_is_valid() and not self.refresh_sessions():
+                return False, "Spotify process not found. Make sure Spotify Desktop is running."
+            try:
+                self._apply(level)
+            except Exception:
+                # Cached handle went stale (session closed or Spotify restarted), look again once
+                if not self.refresh_sessions():
+                    self.handles = {}
+                    return False, "Spotify process not found. Make sure Spotify Desktop is running."
+                try:
+                    self._apply(level)
+                except Exception as e:
+                    self.handles = {}
+                    return False, f"Failed to set session volume: {e}"
+            return True, f"Local Spotify volume set to {percent}%"
+        except Exception as e:
+            self.handles = {}
+            return False, f"Audio session error: {e}"
+
+
+class LatencyTrace:
+    """Where the time went for one volume command, from the key press until its status was shown"""
+
+    def __init__(self, started=None, hook_lag=None):
+        self.started = time.perf_counter() if started is None else started
+        self.hook_lag = hook_lag  # between the OS seeing the key and our hook running, None if not from a hotkey
+        self.reported = None
+        self.stages = {}
+        self._added = 0.0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self._added += seconds
+
+    @contextmanager
+    def timed(self, stage):
+        """Time a block. Stages timed inside it are left out, so a rate limit wait doesn't count as HTTP time."""
+        began = time.perf_counter()
+        added = self._added
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - began - (self._added - added))
+
+
+class LatencyStats:
+    """Rolling latency samples per backend and stage, summarised as percentiles"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, backend, stage, seconds):
+        with self._lock:
+            samples = self._samples.get((backend, stage))
+            if samples is None:
+                samples = self._samples[(backend, stage)] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def finish(self, backend, trace, delivered=True):
+        """Record every stage of a finished trace. delivered=False for results that were never shown
+        (cancelled fades, the slower side of a hedged press)."""
+        for stage, seconds in trace.stages.items():
+            self.record(backend, stage, seconds)
+        if trace.hook_lag is not None:
+            self.record(backend, "hook", trace.hook_lag)
+        if delivered:
+            now = time.perf_counter()
+            if trace.reported is not None:
+                self.record(backend, "status", now - trace.reported)
+            self.record(backend, "total", now - trace.started + (trace.hook_lag or 0.0))
+
+    def summary(self):
+        """{backend: {stage: {"count": n, "p50": ms, "p95": ms, "p99": ms}}}, stages in pipeline order"""
+        with self._lock:
+            snapshot = {key: sorted(samples) for key, samples in self._samples.items()}
+        result = {}
+        for backend in sorted({backend for backend, _ in snapshot}):
+            stages = result[backend] = {}
+            for stage in LATENCY_STAGES:
+                samples = snapshot.get((backend, stage))
+                if not samples:
+                    continue
+                stages[stage] = {"count": len(samples)}
+                for p in LATENCY_PERCENTILES:
+                    # Nearest rank, good enough for a few hundred samples
+                    index = min(len(samples) - 1, max(0, round(p / 100 * len(samples)) - 1))
+                    stages[stage][f"p{p}"] = round(samples[index] * 1000, 2)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class VolumeCommand:
+    """A target volume and how to get there"""
+
+    def __init__(self, volume, fade_duration=0.0, fade_curve="Linear", race=None, device="", trace=None,
+                 failover=False, delta=None):
+        self.volume = volume
+        self.delta = delta  # relative step, volume is worked out from the current volume when it runs
+        self.fade_duration = fade_duration
+        self.fade_curve = fade_curve
+        self.race = race
+        self.device = device
+        self.trace = trace or LatencyTrace()
+        self.failover = failover  # sent to Local because the Web API was unhealthy
+
+    def merge(self, older):
+        """This command replaces older before it ran. Steps add up (so a held key is one request), an absolute
+        volume followed by a step becomes that volume plus the step."""
+        if self.delta is not None:
+            if older.delta is not None:
+                self.delta += older.delta
+            else:
+                self.volume = max(0, min(100, older.volume + self.delta))
+                self.delta = None
+        return self
+
+
+class VolumeDispatcher:
+    """Runs volume commands for one backend on a single worker thread, newest command wins"""
+
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+        self._cond = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        self._thread = None
+        self.submitted = 0
+        self.executed = 0
+        self.coalesced = 0
+        #Only one target volume is kept. If the user presses keys faster than Spotify answers, the older
+        #targets are dropped, so the last press is always the one that ends up applied.
+
+    def submit(self, command):
+        """Queue a VolumeCommand, replacing any command that hasn't started yet"""
+        with self._cond:
+            if self._closed:
+                return
+            self.submitted += 1
+            if self._pending is not None:
+                self.coalesced += 1
+                command = command.merge(self._pending)
+            self._pending = command
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-dispatcher", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._busy = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                if self._closed:
+                    self._pending = None
+                    self._busy = False
+                    self._cond.notify_all()
+                    return
+                command = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                self.handler(command)
+            except Exception:
+                traceback.print_exc()
+            with self._cond:
+                self.executed += 1
+
+    def wait_for_newer(self, timeout):
+        """Sleep up to timeout seconds on the worker thread. Returns True early if a newer command came in, or if
+        the dispatcher is closing."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is not None or self._closed, timeout)
+
+    def wait_idle(self, timeout=None):
+        """Block until every submitted command has been handled or dropped"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def stats(self):
+        with self._cond:
+            return {'submitted': self.submitted, 'executed': self.executed, 'coalesced': self.coalesced}
+
+    def close(self, timeout=None):
+        """Drop anything still queued and end the worker thread once its current command is done.
+        Commands submitted afterwards are ignored."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+
+class VolumeFader:
+    """Moves one backend's volume to a target over time, on that backend's dispatcher thread"""
+
+    def __init__(self, dispatcher, set_volume, max_steps, read_current=None):
+        self.dispatcher = dispatcher
+        self.set_volume = set_volume
+        self.max_steps = max_steps
+        self.read_current = read_current
+        self.current = None
+        #Steps are driven by the clock rather than a fixed list, so a slow request just makes the next step
+        #jump further instead of making the whole fade run late.
+
+    def run(self, command):
+        """Apply the command. Returns (ok, msg), or None if a newer command cancelled the fade."""
+        start = self.current
+        if self.read_current is not None:
+            # A fresher value from outside (e.g. Spotify's player state) beats our own last write
+            known = self.read_current()
+            if known is not None:
+                start = self.current = known
+        target = command.volume
+        duration = command.fade_duration
+        if not duration or start is None or start == target:
+            # Nothing to fade from (first press) or nothing to fade, so set it straight away
+            return self._step(target, command)
+
+        curve = FADE_CURVES.get(command.fade_curve, FADE_CURVES["Linear"])
+        steps = max(1, min(int(self.max_steps(duration)), abs(target - start)))
+        interval = duration / steps
+        began = time.monotonic()
+        while True:
+            t = min(1.0, (time.monotonic() - began) / duration)
+            volume = round(start + (target - start) * curve(t))
+            if volume != self.current or t >= 1.0:
+                result = self._step(volume, command)
+                if result is None or not result[0] or t >= 1.0:
+                    return result
+            if self.dispatcher.wait_for_newer(interval):
+                return None  # A new hotkey press takes over from here
+
+    def _step(self, volume, command):
+        result = self.set_volume(volume, command)
+        if result is not None and result[0]:
+            self.current = volume
+        return result
+
+
+class HedgedRace:
+    """One hedged command sent to several backends. The first success is reported, the rest are ignored."""
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self.failures = {}
+        self.winner = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.winner is not None
+
+    def report(self, backend, ok, msg):
+        """Record a backend's result. Returns the (ok, msg) to show, or None if nothing should be shown."""
+        with self._lock:
+            if self.winner is not None:
+                return None
+            if ok:
+                self.winner = backend
+                return True, msg
+            self.failures[backend] = msg
+            if len(self.failures) < len(self.backends):
+                # Still waiting on the other backend, it may succeed
+                return None
+            return False, "; ".join(f"{name}: {self.failures[name]}" for name in self.backends)
+
+
+class StatusAggregator:
+    """Collects status results from any thread and hands them to the UI at most max_fps times a second.
+    Only the latest status of each source is kept. schedule(delay, flush) must arrange for flush() to run on the UI
+    thread after delay seconds, and is called at most once per frame, so a burst of results costs one redraw
+    instead of one queued event each. Other state the UI shows (like Spotify's current volume, which changes on
+    every fade step) goes through post_value() and arrives in the same frame."""
+
+    def __init__(self, show, schedule, max_fps=STATUS_MAX_FPS):
+        # show(lines, applied, values) on the UI thread, lines = [(ok, msg)] oldest first, values = {name: latest}
+        self.show = show
+        self.schedule = schedule
+        self.interval = 1.0 / max_fps
+        self.flushes = 0
+        self.dropped = 0
+        self._latest = {}
+        self._values = {}
+        self._applied = 0
+        self._delivered = []
+        self._scheduled = False
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def post(self, source, ok, msg, delivered=None):
+        """Safe from any thread. delivered() is called once the status (or a newer one) is on screen."""
+        with self._lock:
+            if source in self._latest:
+                self.dropped += 1
+            self._latest.pop(source, None)
+            self._latest[source] = (ok, msg)
+            if ok:
+                self._applied += 1
+            if delivered is not None:
+                self._delivered.append(delivered)
+            delay = self._next_frame()
+        if delay is not None:
+            self.schedule(delay, self.flush)
+
+    def post_value(self, name, value):
+        """Safe from any thread. Only the latest value of name is shown."""
+        with self._lock:
+            if name in self._values:
+                self.dropped += 1
+            self._values[name] = value
+            delay = self._next_frame()
+        if delay is not None:
+            self.schedule(delay, self.flush)
+
+    def _next_frame(self):
+        #Called with the lock held. Seconds until the next flush may run, None if one is already scheduled.
+        if self._scheduled:
+            return None
+        self._scheduled = True
+        return max(0.0, self._last_flush + self.interval - time.monotonic())
+
+    def flush(self):
+        with self._lock:
+            lines = list(self._latest.values())
+            applied, values, delivered = self._applied, self._values, self._delivered
+            self._latest, self._applied, self._values, self._delivered = {}, 0, {}, []
+            self._scheduled = False
+            self._last_flush = time.monotonic()
+            self.flushes += 1
+        if lines or values:
+            self.show(lines, applied, values)
+        for callback in delivered:
+            callback()
+
+
+class HotkeyTable:
+    """All profile hotkeys behind a single keyboard hook. Each combo is turned into scan codes once, when the
+    table is built, so handling a key press is one dictionary lookup."""
+
+    def __init__(self, keyboard):
+        self.keyboard = keyboard
+        self._key_ids = {}
+        self._actions = {}
+        self._pressed = set()
+        self._hook = None
+
+    def parse(self, hotkey):
+        """Key ids for a combo like "ctrl+alt+v", plus the scan code -> key id entries it needs.
+        Raises ValueError if the keyboard library doesn't know one of the keys."""
+        if "," in hotkey:
+            raise ValueError("key sequences aren't supported, use a single combo like ctrl+alt+v")
+        combo = set()
+        key_ids = {}
+        for name in hotkey.lower().split("+"):
+            name = name.strip()
+            if not name:
+                raise ValueError(f"empty key in '{hotkey}'")
+            codes = self.keyboard.key_to_scan_codes(name)
+            # Left/right variants share an id, so "ctrl" matches either ctrl key
+            key_id = min(codes)
+            for code in codes:
+                key_ids[code] = key_id
+            combo.add(key_id)
+        return frozenset(combo), key_ids
+
+    def rebuild(self, bindings):
+        """Replace every binding. bindings is a list of (profile, hotkey, action), action(hook_lag) gets how long
+        the key event took to reach us. When two profiles share a combo the one listed first keeps it.
+        Returns {profile: error} for the ones that couldn't be bound."""
+        errors = {}
+        key_ids = {}
+        actions = {}
+        for profile, hotkey, action in bindings:
+            try:
+                combo, ids = self.parse(hotkey)
+            except Exception as e:
+                errors[profile] = str(e)
+                continue
+            if combo in actions:
+                errors[profile] = "another profile already uses this hotkey"
+                continue
+            key_ids.update(ids)
+            actions[combo] = action
+        # Swapping whole dicts keeps the hook thread from seeing a half-built table
+        self._key_ids, self._actions = key_ids, actions
+        self._pressed = set()
+        if actions and self._hook is None:
+            self._hook = self.keyboard.hook(self._on_event)
+        elif not actions and self._hook is not None:
+            self.keyboard.unhook(self._hook)
+            self._hook = None
+        return errors
+
+    def clear(self):
+        self.rebuild([])
+
+    def _on_event(self, event):
+        # Keys that aren't part of any hotkey still count as pressed, so ctrl+shift+v doesn't fire ctrl+v
+        key = self._key_ids.get(event.scan_code, ("other", event.scan_code))
+        if event.event_type == "down":
+            self._pressed.add(key)
+            action = self._actions.get(frozenset(self._pressed))
+            if action is not None:
+                # event.time is when the OS hook saw the key, wall clock
+                hook_lag = max(0.0, time.time() - event.time) if getattr(event, "time", None) else 0.0
+                try:
+                    action(hook_lag)
+                except Exception:
+                    traceback.print_exc()
+        else:
+            self._pressed.discard(key)
+
+
+class TraceRecorder:
+    """Records hotkey presses (time, profile, hook lag) so spotivol_soak.py can replay them later.
+    Presses are kept in memory and written once, on save(), to stay off the hook thread's back."""
+
+    def __init__(self, path, max_events=TRACE_MAX_EVENTS):
+        self.path = path
+        self.started = time.monotonic()
+        self.profiles = {}
+        self.events = deque(maxlen=max_events)
+
+    def wrap(self, index, cfg, action):
+        """action, recording each call as a press of profile index (0-based) with config cfg"""
+        self.profiles[index] = dict(cfg)
+
+        def recorded(hook_lag=None):
+            self.events.append({"t": round(time.monotonic() - self.started, 4), "profile": index,
+                                "hook_lag": hook_lag})
+            action(hook_lag)
+        return recorded
+
+    def save(self):
+        profiles = [self.profiles.get(i, {}) for i in range(max(self.profiles, default=-1) + 1)]
+        PERSISTENCE.save(self.path, {"profiles": profiles, "events": list(self.events)})
+
+
+def parse_targets(spec):
+    """Turn a profile's device field into [(account, device)]. Targets are separated by commas and may name an
+    account: "PC, Speaker, work:Kitchen, work:" is two devices on the main account, the Kitchen device on the
+    "work" account and whatever is active on "work". Empty means the main account's active device."""
+    targets = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        account, sep, device = part.partition(":")
+        targets.append((account.strip(), device.strip()) if sep else ("", part))
+    return targets or [("", "")]
+
+
+def valid_account_name(name):
+    """Account names end up in file names (spotify_tokens.<name>.json) and in profile targets ("name:device"), so
+    only letters, digits, spaces, - and _ are allowed. "main" is what the main account is called in the UI."""
+    return bool(name) and name == name.strip() and name != "main" and all(
+        c.isalnum() or c in " -_" for c in name)
+
+
+def target_label(account, device):
+    label = device or "active device"
+    return f"{account}:{label}" if account else label
+
+
+class SpotifyAccount:
+    """One Spotify account and what we know about its player"""
+
+    def __init__(self, auth, active=None):
+        self.auth = auth
+        self.name = auth.name
+        self.playback = PlaybackState()
+        self.devices = DeviceIndex(auth)
+        self.poller = PlaybackPoller(auth, self.playback, self.devices, active=active)
+
+    def forget(self):
+        self.playback.clear()
+        self.devices.invalidate()
+
+
+class VolumeController:
+    """The whole "set Spotify's volume" pipeline: dispatchers, fades, player state and both backends.
+    Results are reported through on_status(ok, message), ok=None meaning "still working on it".
+    Every command is traced stage by stage into self.latency. local_provider is the AudioSessionProvider Local mode
+    uses, this platform's by default (pycaw on Windows, PulseAudio elsewhere)."""
+
+    def __init__(self, auth, on_status=None, local_available=False, mode=MODE_LOCAL, local_provider=None):
+        self.auth = auth
+        self.on_status = on_status or (lambda ok, message: None)
+        self.local_available = local_available
+        self.mode = mode
+
+        # Spotify's player state per account, so repeated presses don't cost a round trip. playback, devices and
+        # playback_poller are the main account's.
+        self.accounts = {}
+        self._started = False
+        main = self.add_account(auth)
+        self.playback = main.playback
+        self.devices = main.devices
+        self.playback_poller = main.poller
+        self.local_controller = LocalVolumeController(local_provider or default_local_provider())
+
+        # Health per backend. The Web API's lives on the shared api_client, which sees every request.
+        self.health = {
+            "local": BackendHealth("local", max_timeout=None),
+            "api": auth.api_client.health,
+        }
+
+        # Latency of every stage per backend. The trace of the command a dispatcher thread is working on is kept
+        # thread-local, so the HTTP/COM code can time itself without passing it through every call.
+        self.latency = LatencyStats()
+        self._tracing = threading.local()
+
+        # One command queue per backend so presses never spawn their own threads
+        self.dispatchers = {
+            "local": VolumeDispatcher("local", self._apply_local_volume),
+            "api": VolumeDispatcher("api", self._apply_api_volume),
+        }
+        self.faders = {
+            "local": VolumeFader(self.dispatchers["local"],
+                                 lambda volume, command: self._set_local_spotify_volume(volume),
+                                 lambda duration: duration / LOCAL_FADE_INTERVAL),
+            "api": VolumeFader(self.dispatchers["api"], self._run_api_volume, self._api_fade_steps,
+                               read_current=self.playback.fresh_volume),
+        }
+
+    def start(self):
+        self._started = True
+        for account in list(self.accounts.values()):
+            account.poller.start()
+        # All accounts share the main account's connections, so one warm-up and keep-alive covers them
+        self.warm_up()
+        interval = self.auth.extra_settings.get("keepalive_interval", KEEPALIVE_INTERVAL)
+        self.auth.api_client.start_keepalive(interval, self.uses_api)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Stop everything start() and the presses started: pollers, dispatcher threads, the keep-alive and the
+        pooled connections. A command that is already talking to a backend gets up to timeout seconds to finish."""
+        for account in list(self.accounts.values()):
+            account.poller.stop(timeout)
+        for dispatcher in self.dispatchers.values():
+            dispatcher.close(timeout)
+        self.auth.api_client.close()
+
+    def warm_up(self):
+        """Open the Web API connections now (e.g. right after login) instead of on the first press"""
+        if self.uses_api():
+            self.auth.api_client.warm_up()
+
+    def uses_api(self):
+        """True if the selected mode sends presses to the Web API and some account is logged in"""
+        return "api" in MODE_BACKENDS.get(self.mode, ()) and any(
+            account.auth.access_token for account in list(self.accounts.values()))
+
+    def add_account(self, auth):
+        """Make another Spotify account available to profiles (as "name:device" targets)"""
+        # Polling only runs while the selected mode uses the Web API, like the keep-alive
+        account = self.accounts[auth.name] = SpotifyAccount(auth, active=self.uses_api)
+        if self._started:
+            account.poller.start()
+        return account
+
+    def forget_account(self, name=""):
+        """Drop everything we know about the logged-out account"""
+        account = self.accounts.get(name)
+        if account is not None:
+            account.forget()
+
+    def apply_volume(self, volume: int, fade: float = 0.0, curve: str = "Linear", device: str = ""):
+        #Queues the volume on the dispatcher of the selected mode. Safe to call from any thread, returns immediately.
+        #A new command also cancels any fade that is still running on that backend.
+        self.prepare(volume, fade, curve, device)()
+
+    def prepare(self, volume: int, fade: float = 0.0, curve: str = "Linear", device: str = "", delta=None):
+        """Resolve the backends for the current mode once and return a function that queues this volume.
+        Hotkeys keep the returned function, so prepare again when the mode changes."""
+        backends = MODE_BACKENDS[self.mode]
+        dispatchers = [self.dispatchers[backend] for backend in backends]
+        hedged = len(backends) > 1
+
+        def fire(hook_lag=None):
+            race = HedgedRace(backends) if hedged else None
+            started = time.perf_counter()
+            if backends == ("api",) and self.should_fail_over():
+                trace = LatencyTrace(started, hook_lag)
+                self.dispatchers["local"].submit(VolumeCommand(volume, fade, curve, None, "", trace, failover=True,
+                                                               delta=delta))
+                return
+            for dispatcher in dispatchers:
+                trace = LatencyTrace(started, hook_lag)
+                dispatcher.submit(VolumeCommand(volume, fade, curve, race, device, trace, delta=delta))
+
+        return fire
+
+    def prepare_step(self, delta: int, fade: float = 0.0, curve: str = "Linear", device: str = ""):
+        """Like prepare(), for a relative step such as +5 or -5. The new volume is worked out on the dispatcher
+        from the volume we already know, so a step costs one request, and repeats that arrive before it runs
+        are added up into that same request."""
+        return self.prepare(None, fade, curve, device, delta=int(delta))
+
+    def prepare_profile(self, cfg):
+        if cfg.get("step"):
+            return self.prepare_step(cfg["step"], float(cfg["fade"]), cfg["curve"], cfg["device"])
+        return self.prepare(int(cfg["volume"]), float(cfg["fade"]), cfg["curve"], cfg["device"])
+
+    def step_volume(self, delta: int, fade: float = 0.0, curve: str = "Linear", device: str = ""):
+        #Queues a relative change. Safe to call from any thread, returns immediately.
+        self.prepare_step(delta, fade, curve, device)()
+
+    def should_fail_over(self):
+        """True when Web API presses should go to Local instead: the API's circuit is open and Local works"""
+        if not self.auth.extra_settings.get("api_failover", True):
+            return False
+        return (self.health["api"].state == "open" and bool(self.local_available)
+                and self.health["local"].state != "open")
+
+    def health_stats(self):
+        return {name: health.snapshot() for name, health in self.health.items()}
+
+    def current_volume(self):
+        """Best known current volume for the selected mode, None if we don't know it yet"""
+        for backend in MODE_BACKENDS[self.mode]:
+            if backend == "api":
+                volume = self.playback.fresh_volume()
+                if volume is not None:
+                    return volume
+            if self.faders[backend].current is not None:
+                return self.faders[backend].current
+        return None
+
+    def wait_idle(self, timeout=None):
+        """Block until every dispatcher has finished its queued work"""
+        return all(d.wait_idle(timeout) for d in self.dispatchers.values())
+
+    def dispatch_stats(self):
+        return {name: d.stats() for name, d in self.dispatchers.items()}
+
+    def _base_volume(self, backend):
+        #What a relative step starts from: player state if it's fresh, else our own last successful set.
+        #Only when we know nothing at all does it cost a read (GET /me/player, or the session volume locally).
+        if backend == "api":
+            volume = self.playback.fresh_volume()
+            if volume is None:
+                volume = self.faders["api"].current
+            if volume is None and self.auth.access_token:
+                self.playback_poller.poll_once()
+                volume = self.playback.volume
+            return volume
+        volume = self.faders["local"].current
+        if volume is None and self.local_available:
+            volume = self.local_controller.get_volume()
+        return volume
+
+    def _api_fade_steps(self, duration):
+        #Don't step faster than Spotify answers and only use part of what's left of the rate budget
+        api_client = self.auth.api_client
+        interval = max(api_client.latency or 0, API_FADE_MIN_INTERVAL)
+        budget = int(api_client.limiter.budget(duration) * API_FADE_BUDGET_SHARE)
+        return max(1, min(duration / interval, budget))
+
+    def _report(self, backend, command, ok, msg):
+        race = command.race
+        if race is not None:
+            result = race.report(backend, ok, msg)
+            if result is None:
+                self.latency.finish(backend, command.trace, delivered=False)
+                return
+            ok, msg = result
+            if ok:
+                msg = f"{msg} (hedged, {backend} answered first)"
+        if command.failover and ok:
+            msg = f"{msg} (Web API unreachable, used Local instead)"
+        command.trace.reported = time.perf_counter()
+        self._tracing.status = (backend, command.trace)
+        self.on_status(ok, msg)
+        if self._tracing.status is not None:
+            # Nobody claimed it, so the status was delivered by the time on_status returned
+            self._tracing.status = None
+            self.latency.finish(backend, command.trace)
+
+    def status_source(self):
+        """The backend whose result on_status is being called with on this thread, None for other messages"""
+        current = getattr(self._tracing, "status", None)
+        return None if current is None else current[0]
+
+    def claim_status_trace(self):
+        """For on_status callbacks that show the status later (like the GUI's event queue): call from inside
+        on_status and call the returned function once the status is on screen. None if there's nothing to time."""
+        current = getattr(self._tracing, "status", None)
+        self._tracing.status = None
+        if current is None:
+            return None
+        backend, trace = current
+        return lambda: self.latency.finish(backend, trace)
+
+    def _trace(self):
+        #The trace of the command this dispatcher thread is running (a throwaway one outside a command)
+        return getattr(self._tracing, "trace", None) or LatencyTrace()
+
+    def _apply_local_volume(self, command):
+        self._apply_command("local", command)
+
+    def _apply_api_volume(self, command):
+        self._apply_command("api", command)
+
+    def _apply_command(self, backend, command):
+        race = command.race
+        if race is not None and race.finished:
+            return  # The other backend already won this race
+        trace = command.trace
+        trace.add("dispatch", time.perf_counter() - trace.started)
+        self._tracing.trace = trace
+        try:
+            result = None
+            if command.delta is not None:
+                base = self._base_volume(backend)
+                if base is None:
+                    # Nothing to step from. Logged out is the usual reason in the Web API modes.
+                    if backend == "api" and not self.auth.access_token:
+                        result = False, NOT_LOGGED_IN_MESSAGE
+                    else:
+                        result = False, "Current volume unknown, set an absolute volume first"
+                else:
+                    command.volume = max(0, min(100, base + command.delta))
+            if result is None:
+                result = self.faders[backend].run(command)
+            if result is None:
+                # Cancelled by a newer press, which will report its own result
+                self.latency.finish(backend, trace, delivered=False)
+                return
+            ok, msg = result
+        except Exception as e:
+            ok, msg = False, f"Unexpected error: {e}\n{traceback.format_exc()}"
+        finally:
+            self._tracing.trace = None
+        self._report(backend, command, ok, msg)
+
+    def _run_api_volume(self, volume: int, command=None):
+        targets = parse_targets(command.device if command is not None else "")
+        if len(targets) > 1:
+            return self._run_api_group(volume, targets)
+        account_name, device = targets[0]
+        account = self.accounts.get(account_name)
+        if account is None:
+            return False, f"Unknown Spotify account '{account_name}'"
+        return self._run_api_target(volume, account, device)
+
+    def _run_api_target(self, volume, account, device):
+        #Codes to apply volume that is chosen and messages to give as feedback when tokens run out
+        auth, playback = account.auth, account.playback
+        if not auth.access_token:
+            return False, NOT_LOGGED_IN_MESSAGE
+
+        # Skip the round trip when the player state already tells us the answer
+        if playback.is_fresh() and (not device or account.devices.resolve(device) == playback.device_id):
+            if playback.supports_volume is False:
+                return False, f"{playback.device_name or 'Active device'} doesn't support volume control"
+            if playback.fresh_volume() == volume:
+                return True, f"Spotify API volume already at {volume}%"
+
+        with self._trace().timed("token"):
+            ok, msg = auth.ensure_fresh_token()
+        if not ok:
+            return False, f"Token expired. Please login again. ({msg})"
+
+        token = auth.access_token
+        result = self._set_spotify_api_volume(volume, device, account)
+        if result is None:
+            return None  # Replaced by a newer press while waiting out the rate limit
+        ok, msg = result
+        # If token expired, try to refresh
+        if not ok and "401" in msg:
+            if auth.access_token == token:
+                with self._trace().timed("token"):
+                    refresh_ok, refresh_msg = auth.refresh_access_token()
+            else:
+                # Another press already refreshed it while this request was in flight
+                refresh_ok, refresh_msg = True, ""
+            if refresh_ok:
+                # Retry with new token that is given
+                return self._set_spotify_api_volume(volume, device, account)
+            msg = f"Token expired. Please login again. ({refresh_msg})"
+        return ok, msg
+
+    def _run_api_group(self, volume, targets):
+        #One press, several accounts/devices: every PUT goes out at the same time on the I/O loop. Anything that
+        #needs recovering (401, 404, 429, timeouts) goes through the single-target path afterwards, which knows how.
+        results = {}
+        ready = []
+        for account_name, device in targets:
+            label = target_label(account_name, device)
+            account = self.accounts.get(account_name)
+            if account is None:
+                results[label] = False, "unknown account"
+                continue
+            if not account.auth.access_token:
+                results[label] = False, "not logged in"
+                continue
+            with self._trace().timed("token"):
+                ok, msg = account.auth.ensure_fresh_token()
+            if not ok:
+                results[label] = False, "token expired, login again"
+                continue
+            try:
+                device_id = self._resolve_device(device, account=account)
+                if device and device_id is None:
+                    device_id = self._resolve_device(device, refresh=True, account=account)
+            except Exception as e:
+                results[label] = False, f"request error: {e}"
+                continue
+            if device and device_id is None:
+                results[label] = False, "device not found"
+                continue
+            ready.append((label, account, device, device_id))
+
+        api_client = self.auth.api_client
+        prepared = [api_client.prepare_volume(account.auth.access_token, volume, device_id)
+                    for _, account, _, device_id in ready]
+        with self._trace().timed("call"):
+            responses = api_client.send_many_api(prepared, wait=self._wait_for_rate_limit) if prepared else []
+        if responses is None:
+            return None  # Replaced by a newer press while waiting out the rate limit
+
+        for (label, account, device, device_id), r in zip(ready, responses):
+            if isinstance(r, CircuitOpenError):
+                results[label] = False, str(r)
+            elif not isinstance(r, Exception) and r.status_code in (204, 202):
+                if device_id is None or device_id == account.playback.device_id:
+                    account.playback.note_volume(volume)
+                results[label] = True, ""
+            else:
+                result = self._run_api_target(volume, account, device)
+                if result is None:
+                    return None
+                results[label] = result
+        return self._group_status(volume, targets, results)
+
+    def _group_status(self, volume, targets, results):
+        #All targets in one status line, e.g. "40% on 2/3 targets: PC ✓, Speaker ✓, work:Kitchen ✗ (not found)"
+        parts = []
+        for account_name, device in targets:
+            label = target_label(account_name, device)
+            ok, msg = results[label]
+            parts.append(f"{label} ✓" if ok else f"{label} ✗ ({msg})")
+        succeeded = sum(1 for ok, _ in results.values() if ok)
+        return succeeded == len(results), f"Spotify API volume {volume}% on {succeeded}/{len(results)} targets: " \
+                                          + ", ".join(parts)
+
+    def _set_local_spotify_volume(self, percent: int):
+        if self.local_available is None:
+            # Pressed before the background check finished, so check right here
+            self.local_available = local_mode_available()
+        if not self.local_available:
+            if local_backend() == "pycaw":
+                return False, "pycaw not available (pip install pycaw comtypes psutil)."
+            return False, "pulsectl not available (pip install pulsectl, needs PulseAudio or pipewire-pulse)."
+
+        started = time.perf_counter()
+        with self._trace().timed("call"):
+            ok, msg = self.local_controller.set_volume(percent)
+        self.health["local"].record(ok, time.perf_counter() - started)
+        return ok, msg
+
+    def _wait_for_rate_limit(self, delay):
+        #Runs on the API dispatcher thread while the limiter holds a request back. Returns True when a newer
+        #press came in, so only the latest target gets sent once Spotify lets us through again.
+        limiter = self.auth.api_client.limiter
+        retry_after = limiter.retry_after()
+        if retry_after:
+            self.on_status(None, f"Rate limited by Spotify, sending latest volume in {retry_after:.1f}s "
+                                 f"(throttled {limiter.throttled_count}x)")
+        elif delay >= 0.5:
+            self.on_status(None, f"Request budget used up, sending latest volume in {delay:.1f}s")
+        with self._trace().timed("throttle"):
+            return self.dispatchers["api"].wait_for_newer(delay)
+
+    def _resolve_device(self, device, refresh=False, account=None):
+        #Turns a profile's device name into a device_id. Without a name we still send the active device's id,
+        #so Spotify doesn't have to work out which device we mean.
+        account = account or self.accounts[self.auth.name]
+        devices, playback = account.devices, account.playback
+        if refresh or devices.is_stale():
+            devices.refresh(wait=self._wait_for_rate_limit)
+        if device:
+            return devices.resolve(device)
+        if playback.is_fresh() and playback.device_id:
+            return playback.device_id
+        return devices.default_id()
+
+    def _send_volume(self, percent, device_id, account=None):
+        #Retries 429s once the limiter allows, and timeouts/connection errors/5xx with jittered backoff.
+        #Returns the response, or None if a newer press took over.
+        auth = (account or self.accounts[self.auth.name]).auth
+        rate_limited = retries = 0
+        while True:
+            try:
+                with self._trace().timed("call"):
+                    r = auth.api_client.put_volume(auth.access_token, percent, device_id,
+                                                   wait=self._wait_for_rate_limit)
+            except CircuitOpenError:
+                raise
+            except Exception:
+                if retries >= API_MAX_RETRIES:
+                    raise
+            else:
+                if r is None:
+                    return None
+                if r.status_code == 429 and rate_limited < API_MAX_RATE_LIMIT_RETRIES:
+                    # The limiter now holds the retry until Retry-After has passed
+                    rate_limited += 1
+                    continue
+                if r.status_code < 500 or retries >= API_MAX_RETRIES:
+                    return r
+            retries += 1
+            if self._backoff(retries):
+                return None
+
+    def _backoff(self, attempt):
+        #Exponential backoff with jitter, cut short by a newer press. Returns True if one came in.
+        delay = RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        with self._trace().timed("throttle"):
+            return self.dispatchers["api"].wait_for_newer(delay)
+
+    def _set_spotify_api_volume(self, percent: int, device: str = "", account=None):
+        """Set volume using Spotify Web API"""
+        account = account or self.accounts[self.auth.name]
+        try:
+            device_id = self._resolve_device(device, account=account)
+            if device and device_id is None:
+                device_id = self._resolve_device(device, refresh=True, account=account)
+                if device_id is None:
+                    return False, f"Spotify device '{device}' not found"
+
+            r = self._send_volume(percent, device_id, account)
+            if r is not None and r.status_code == 404:
+                # Device went away or got a new id, look it up again once
+                account.devices.invalidate()
+                new_id = self._resolve_device(device, refresh=True, account=account)
+                if new_id is not None and new_id != device_id:
+                    device_id = new_id
+                    r = self._send_volume(percent, device_id, account)
+            if r is None:
+                return None
+
+            if r.status_code in (204, 202):
+                if device_id is None or device_id == account.playback.device_id:
+                    account.playback.note_volume(percent)
+                return True, f"Spotify API volume set to {percent}%" + (f" on {device}" if device else "")
+            else:
+                if r.status_code != 401:
+                    account.devices.invalidate()
+                try:
+                    j = r.json()
+                    return False, f"API error {r.status_code}: {j.get('error', {}).get('message', j)}"
+                except Exception:
+                    return False, f"API error {r.status_code}: {r.text}"
+        except Exception as e:
+            return False, f"Request error: {str(e) or type(e).__name__}"
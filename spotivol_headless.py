@@ -0,0 +1,140 @@
+import sys
+from spotivol_startup import STARTUP
+
+# Must happen before the imports below so --profile-startup can time them
+STARTUP.install_if_requested(sys.argv)
+
+import signal
+import threading
+import argparse
+
+from spotivol_core import (MODE_BACKENDS, SETTINGS_FILE, PERSISTENCE, SpotifyAuth, VolumeController, ProfileStore,
+                           HotkeyTable, TraceRecorder, local_mode_available, platform_mode, optional_import)
+from spotivol_control import ControlServer, control_request
+from spotivol_metrics import MetricsServer
+
+STARTUP.mark("imports")
+
+"""
+Headless SpotiVol: no window, just hotkey -> set volume. Runs as a background service.
+It only imports spotivol_core, never PyQt5, so it starts faster and uses a lot less memory than the GUI.
+Profiles, mode and credentials are read from the same files the GUI saves (spotify_profiles.json,
+spotify_settings.json, spotify_tokens.json), so set things up and log in with the GUI first.
+"""
+
+
+def print_status(ok, message):
+    if ok:
+        print(f"✓ {message}")
+    elif ok is None:
+        print(f"⏳ {message}")
+    else:
+        print(f"✗ {message}")
+
+
+def bind_profiles(controller, store, recorder=None):
+    #Binds every profile the GUI left bound, all on one keyboard hook. recorder (a TraceRecorder) records presses.
+    #Returns (table, how many got bound), table is None if hotkeys aren't available at all.
+    keyboard = optional_import("keyboard")
+    if keyboard is None:
+        print("✗ 'keyboard' package not available, hotkeys can't be bound.")
+        return None, 0
+
+    table = HotkeyTable(keyboard)
+    profiles = store.bound_profiles()
+    bindings = []
+    for i, cfg in enumerate(profiles):
+        action = controller.prepare_profile(cfg)
+        if recorder is not None:
+            action = recorder.wrap(store.profiles.index(cfg), cfg, action)
+        bindings.append((i, cfg["hotkey"], action))
+    errors = table.rebuild(bindings)
+    for i, cfg in enumerate(profiles):
+        if i in errors:
+            print(f"✗ {cfg['name']}: could not bind {cfg['hotkey']}: {errors[i]}")
+        else:
+            change = f"{int(cfg['step']):+d}%" if cfg.get("step") else f"{cfg['volume']}%"
+            print(f"✓ {cfg['name']}: {cfg['hotkey']} → {change}")
+    return table, len(profiles) - len(errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run SpotiVol hotkeys without the GUI.")
+    parser.add_argument("--mode", choices=list(MODE_BACKENDS), help="override the mode saved by the GUI")
+    parser.add_argument("--send", metavar="REQUEST",
+                        help='send one request to a running SpotiVol (e.g. "apply 1" or "set +5") and exit')
+    parser.add_argument("--endpoint", help="control endpoint for --send, defaults to the one in the settings file")
+    # --profile-startup is handled (and removed from argv) by spotivol_startup before we get here
+    args = parser.parse_args(argv)
+
+    if args.send:
+        try:
+            endpoint = args.endpoint or PERSISTENCE.load(SETTINGS_FILE)[0].get("control_endpoint")
+            answer = control_request(args.send, endpoint)
+        except OSError as e:
+            print(f"err SpotiVol is not running ({e})")
+            return 1
+        print(answer)
+        return 0 if answer.startswith("ok") else 1
+
+    store = ProfileStore()
+    mode = args.mode or store.mode
+    if mode not in MODE_BACKENDS:
+        print("✗ No mode saved yet. Open the GUI once, or pass --mode.")
+        return 1
+    if platform_mode(mode) != mode:
+        print(f"{mode} isn't available on this system, using {platform_mode(mode)}")
+        mode = platform_mode(mode)
+
+    STARTUP.mark("profiles loaded")
+    auth = SpotifyAuth()
+    STARTUP.mark("auth loaded")
+    # pycaw or pulsectl is only worth importing if the mode can use it
+    local_available = local_mode_available() if "local" in MODE_BACKENDS[mode] else False
+    controller = VolumeController(auth, on_status=print_status, local_available=local_available, mode=mode)
+    for extra in auth.extra_accounts():
+        controller.add_account(extra)
+    STARTUP.mark("controller built")
+    print(f"SpotiVol headless, mode: {mode}")
+    trace_path = auth.extra_settings.get("record_trace")
+    recorder = TraceRecorder(trace_path) if trace_path else None
+    hotkeys, bound = bind_profiles(controller, store, recorder)
+    STARTUP.mark("hotkeys bound")
+    control_server = ControlServer(controller, lambda: store.profiles, auth.extra_settings.get("control_endpoint"))
+    control_ok, control_msg = control_server.start()
+    print(control_msg)
+    metrics_server = MetricsServer(controller, auth.extra_settings.get("metrics_port"))
+    metrics_ok, metrics_msg = metrics_server.start()
+    if metrics_ok:
+        print(metrics_msg)
+    if not bound and not control_ok:
+        print("✗ Nothing to listen to: no hotkeys bound and no control endpoint.")
+        return 1
+    controller.start()
+    if STARTUP.enabled:
+        print(STARTUP.report("hotkeys bound"))
+        control_server.stop()
+        metrics_server.stop()
+        controller.close()
+        auth.cancel_scheduled_refresh()
+        return 1 if STARTUP.over_budget("hotkeys bound") else 0
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    # Event.wait with a timeout keeps Ctrl+C working on Windows
+    while not stop.wait(1):
+        pass
+    if hotkeys is not None:
+        hotkeys.clear()
+    if recorder is not None:
+        recorder.save()
+    control_server.stop()
+    metrics_server.stop()
+    controller.close()
+    auth.cancel_scheduled_refresh()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
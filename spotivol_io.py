@@ -0,0 +1,354 @@
+import ssl
+import json
+import base64
+import socket
+import asyncio
+import threading
+import concurrent.futures
+from urllib.parse import urlsplit, parse_qs
+from requests.certs import where as ca_bundle
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_auth_from_url, get_environ_proxies, select_proxy
+
+"""
+The I/O engine: one asyncio event loop on one thread that does all of SpotiVol's network I/O.
+The Spotify HTTP client, token exchange/refresh, the refresh timer and the OAuth callback listener all run on it,
+so timeouts and cancellation are handled in one place instead of on a thread per job.
+Other threads hand it coroutines with submit() (returns a concurrent.futures.Future) or call() (waits for the result).
+Qt gets results through signals emitted from a future's done callback.
+requests is only used for its CA bundle, header dict and proxy rules (HTTPS_PROXY, NO_PROXY...), the HTTP itself
+is plain asyncio streams. https goes through a proxy with CONNECT, plain http as an absolute-URL request.
+"""
+
+CALLBACK_SUCCESS_PAGE = b"""
+                    <html>
+                    <body>
+                        <h1>Success!</h1>
+                        <p>You can close this window and return to the application.</p>
+                    </body>
+                    </html>
+                """
+CALLBACK_ERROR_PAGE = b'<h1>Error: No code received</h1>'
+MAX_HEADER_LINES = 100
+MAX_PROXY_ANSWER = 65536
+
+
+class HttpResponse:
+    """The parts of requests.Response the Spotify code uses"""
+
+    def __init__(self, status_code, reason, headers, content, url):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode(errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncHttpClient:
+    """Small HTTP/1.1 client on asyncio streams that keeps up to pool_size idle connections per host.
+    Honors the proxy environment variables the same way requests does. Only use it from the engine's loop."""
+
+    def __init__(self, pool_size=4, connect_timeout=3.05, read_timeout=8):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = {}
+        self._proxies = {}
+        self._ssl = None
+
+    def _ssl_context(self):
+        if self._ssl is None:
+            # Same CA bundle requests would use
+            self._ssl = ssl.create_default_context(cafile=ca_bundle())
+        return self._ssl
+
+    def _proxy(self, key, url):
+        """The proxy url for this host, None for a direct connection. Looked up once per host, like the
+        environment it comes from, the proxy doesn't change while we run."""
+        if key not in self._proxies:
+            self._proxies[key] = select_proxy(url, get_environ_proxies(url))
+        return self._proxies[key]
+
+    @staticmethod
+    def _proxy_auth(proxy):
+        username, password = get_auth_from_url(proxy)
+        if not username:
+            return []
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        return [f"Proxy-Authorization: Basic {token}"]
+
+    async def _connect(self, key, proxy):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        if proxy is None:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=self._ssl_context() if scheme == "https" else None),
+                self.connect_timeout)
+        elif scheme == "https":
+            sock = await asyncio.wait_for(self._tunnel(proxy, host, port), self.connect_timeout)
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(sock=sock, ssl=self._ssl_context(), server_hostname=host),
+                    self.connect_timeout)
+            except BaseException:
+                sock.close()
+                raise
+        else:
+            proxy_parts = urlsplit(proxy)
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(proxy_parts.hostname, proxy_parts.port or 80), self.connect_timeout)
+        return reader, writer, False
+
+    async def _tunnel(self, proxy, host, port):
+        """A socket to the proxy that it has connected through to host:port with CONNECT, ready for TLS"""
+        parts = urlsplit(proxy)
+        if parts.scheme.lower() != "http":
+            raise ConnectionError(f"Unsupported proxy {proxy!r}, only http:// proxies can tunnel https")
+        loop = asyncio.get_running_loop()
+        family, kind, proto, _, address = (await loop.getaddrinfo(parts.hostname, parts.port or 80,
+                                                                  type=socket.SOCK_STREAM))[0]
+        sock = socket.socket(family, kind, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+            lines = [f"CONNECT {host}:{port} HTTP/1.1", f"Host: {host}:{port}"] + self._proxy_auth(proxy)
+            await loop.sock_sendall(sock, ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            # The proxy says nothing after its answer until we start TLS, so reading up to the blank line is safe
+            answer = b""
+            while b"\r\n\r\n" not in answer:
+                chunk = await loop.sock_recv(sock, 4096)
+                if not chunk or len(answer) > MAX_PROXY_ANSWER:
+                    raise ConnectionError(f"Proxy {parts.hostname} closed the connection during CONNECT")
+                answer += chunk
+            status_line = answer.split(b"\r\n", 1)[0].decode("latin-1")
+            if status_line.split(" ")[1:2] != ["200"]:
+                raise ConnectionError(f"Proxy refused the tunnel to {host}:{port}: {status_line}")
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _release(self, key, reader, writer):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.pool_size:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def request(self, method, url, headers=None, body=None, timeout=None):
+        """Send one request and read the whole response. Raises on connection errors and timeouts.
+        timeout overrides the read timeout for this request."""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        proxy = self._proxy(key, url)
+        plain_proxy = proxy is not None and scheme != "https"
+        if plain_proxy:
+            # A proxy that isn't tunnelling wants the whole URL
+            target = f"{scheme}://{parts.netloc}{target}"
+        if isinstance(body, str):
+            body = body.encode()
+        body = body or b""
+
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}", "User-Agent: SpotiVol",
+                 "Accept-Encoding: identity", "Connection: keep-alive"]
+        if plain_proxy:
+            lines += self._proxy_auth(proxy)
+        for name, value in (headers or {}).items():
+            if name.lower() not in ("host", "user-agent", "accept-encoding", "connection", "content-length"):
+                lines.append(f"{name}: {value}")
+        if body or method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(body)}")
+        data = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+        for attempt in range(2):
+            reader, writer, reused = await self._connect(key, proxy)
+            try:
+                writer.write(data)
+                await writer.drain()
+                response, keep_alive = await asyncio.wait_for(self._read_response(reader, method, url),
+                                                              timeout or self.read_timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused and attempt == 0:
+                    continue  # The server closed the idle connection, try once more on a new one
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._release(key, reader, writer)
+            else:
+                writer.close()
+            return response
+
+    async def warm(self, url, connections=1):
+        """Open up to connections connections to url's host ahead of time (DNS, TCP and TLS) and leave them in the
+        pool. Each gets a HEAD request, so running it again over open connections also keeps them from idling out.
+        Returns how many answered."""
+        count = max(1, min(connections, self.pool_size))
+        results = await asyncio.gather(*(self.request("HEAD", url) for _ in range(count)), return_exceptions=True)
+        return sum(1 for r in results if isinstance(r, HttpResponse))
+
+    async def _read_response(self, reader, method, url):
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("Connection closed before the response")
+            version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+            status = int(status)
+            headers = CaseInsensitiveDict()
+            for _ in range(MAX_HEADER_LINES):
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip()] = value.strip()
+            if status >= 200:
+                break  # 1xx answers are followed by the real one
+
+        keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304):
+            content = b""
+        elif "chunked" in headers.get("Transfer-Encoding", "").lower():
+            content = await self._read_chunked(reader)
+        elif "Content-Length" in headers:
+            content = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return HttpResponse(status, reason, headers, content, url), keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def close(self):
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+class OAuthCallbackListener:
+    """Waits on the loop for Spotify to redirect the browser back to us with ?code=..."""
+
+    def __init__(self, redirect_uri):
+        parts = urlsplit(redirect_uri)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+        self._server = None
+        self._code = None
+
+    async def start(self):
+        """Start listening. Raises OSError if the port is taken."""
+        self._code = asyncio.get_running_loop().create_future()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def wait(self, timeout):
+        """The authorization code, or None if none came back within timeout seconds"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._code), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            for _ in range(MAX_HEADER_LINES):
+                if (await asyncio.wait_for(reader.readline(), 10)) in (b"\r\n", b"\n", b""):
+                    break
+            target = (request_line.decode("latin-1").split(" ") + ["", ""])[1]
+            parts = urlsplit(target)
+            if parts.path != self.path:
+                self._respond(writer, "404 Not Found", b"")
+                return
+            code = parse_qs(parts.query).get("code", [None])[0]
+            if code:
+                self._respond(writer, "200 OK", CALLBACK_SUCCESS_PAGE)
+                if not self._code.done():
+                    self._code.set_result(code)
+            else:
+                self._respond(writer, "400 Bad Request", CALLBACK_ERROR_PAGE)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, writer, status, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-type: text/html\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+
+
+class IoEngine:
+    """Runs the asyncio loop on a daemon thread, started on first use"""
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self.loop.run_forever, name="io-engine", daemon=True)
+                self._thread.start()
+        return self.loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop from any thread. Cancelling the returned future cancels it."""
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def call(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result. Never call this from the loop itself."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("IoEngine.call() would block its own loop, await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def call_later(self, delay, callback):
+        """Run callback on the loop after delay seconds. Returns a future, cancel() it to call it off."""
+        async def later():
+            await asyncio.sleep(delay)
+            callback()
+        return self.submit(later())
+
+
+# Shared by everything in the process
+IO_ENGINE = IoEngine()
@@ -0,0 +1,88 @@
+import json
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+"""
+Optional local metrics endpoint, a small http.server on its own thread.
+Off unless "metrics_port" is set in spotify_settings.json. It only listens on 127.0.0.1.
+
+    GET /metrics       latency percentiles and dispatcher counters in Prometheus text format
+    GET /metrics.json  the same numbers as JSON
+"""
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers metrics requests for the controller set on the server"""
+
+    def do_GET(self):
+        controller = self.server.controller
+        if self.path == "/metrics.json":
+            body = json.dumps({"latency_ms": controller.latency.summary(),
+                               "dispatch": controller.dispatch_stats(),
+                               "health": controller.health_stats()}).encode()
+            content_type = "application/json"
+        elif self.path == "/metrics":
+            body = prometheus_text(controller).encode()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Suppress server logs
+
+
+def prometheus_text(controller):
+    lines = ["# HELP spotivol_latency_ms Latency of each stage of a volume change, rolling window",
+             "# TYPE spotivol_latency_ms summary"]
+    for backend, stages in controller.latency.summary().items():
+        for stage, values in stages.items():
+            labels = f'backend="{backend}",stage="{stage}"'
+            for key, value in values.items():
+                if key == "count":
+                    lines.append(f"spotivol_latency_ms_count{{{labels}}} {value}")
+                else:
+                    quantile = int(key[1:]) / 100
+                    lines.append(f'spotivol_latency_ms{{{labels},quantile="{quantile}"}} {value}')
+    lines.append("# TYPE spotivol_commands_total counter")
+    for backend, counters in controller.dispatch_stats().items():
+        for name, value in counters.items():
+            lines.append(f'spotivol_commands_total{{backend="{backend}",result="{name}"}} {value}')
+    lines.append("# TYPE spotivol_backend_healthy gauge")
+    for backend, health in controller.health_stats().items():
+        lines.append(f'spotivol_backend_healthy{{backend="{backend}"}} {int(health["state"] == "closed")}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves /metrics on a daemon thread"""
+
+    def __init__(self, controller, port):
+        self.controller = controller
+        self.port = port
+        self._server = None
+
+    def start(self):
+        """Returns (ok, message)"""
+        if not self.port:
+            return False, "Metrics endpoint is switched off"
+        try:
+            server = HTTPServer(('127.0.0.1', int(self.port)), MetricsHandler)
+        except Exception as e:
+            return False, f"Metrics endpoint not started: {e}"
+        server.controller = self.controller
+        self._server = server
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return True, f"Metrics on http://127.0.0.1:{server.server_address[1]}/metrics"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from spotivol_core import (MODE_API, MODE_HEDGED, PERSISTENCE, SETTINGS_FILE, PROFILE_DEFAULTS,
+                           LocalVolumeController, RateLimiter, local_mode, optional_import)
+from spotivol_bench import (BENCH_ACCESS_TOKEN_LIFETIME, FakeSpotifyServer, FakeSessionProvider,
+                            bench_environment)
+
+"""
+Soak harness: replays hotkey traces against MainWindow.apply_volume for as long as you like and checks that
+SpotiVol's resources stay bounded. Spotify is the stand-in server from spotivol_bench and Local mode runs on fake
+audio sessions, so it needs neither Spotify nor Windows (Qt can run offscreen: QT_QPA_PLATFORM=offscreen).
+
+Record a trace from real use by adding "record_trace": "trace.json" to spotify_settings.json (GUI or headless,
+written on exit), or let the harness make one up with bursts, held keys and idle gaps:
+
+    python spotivol_soak.py --trace trace.json --speedup 20 --repeat 50
+    python spotivol_soak.py --synthetic 600 --mode hedged --duration 300
+
+RSS, live threads and the number of UI events waiting in Qt's queue are sampled while it runs. The exit code is 1
+if any of them keeps growing: the end of the run is compared against the run after warm-up.
+"""
+
+SOAK_SAMPLE_INTERVAL = 0.5
+SOAK_WARMUP_SHARE = 0.25
+# Allowed growth from the warmed-up part of the run to its last quarter
+SOAK_THREAD_SLACK = 2
+SOAK_QUEUE_SLACK = 50
+SOAK_RSS_SLACK_MB = 16
+SOAK_RSS_SLACK_SHARE = 0.10
+SOAK_MODES = {"local": local_mode(), "api": MODE_API, "hedged": MODE_HEDGED}
+SYNTHETIC_PROFILES = [
+    {"name": "Quiet", "volume": 20},
+    {"name": "Loud", "volume": 90},
+    {"name": "Fade", "volume": 50, "fade": 1.0},
+    {"name": "Up", "step": 5},
+    {"name": "Down", "step": -5},
+]
+
+
+def rss_bytes():
+    """Resident memory of this process, None if there's no way to read it here"""
+    psutil = optional_import("psutil")
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def synthetic_trace(seconds, seed=0):
+    """A made-up trace of seconds of use: single presses, hotkey spam, held step keys and idle gaps"""
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    while t < seconds:
+        profile = rng.randrange(len(SYNTHETIC_PROFILES))
+        kind = rng.random()
+        if kind < 0.5:
+            events.append({"t": round(t, 4), "profile": profile})
+        elif kind < 0.75:
+            # Spamming one key
+            for _ in range(rng.randint(5, 20)):
+                events.append({"t": round(t, 4), "profile": profile})
+                t += rng.uniform(0.03, 0.12)
+        else:
+            # Holding a step key, the OS repeats it about 30 times a second
+            profile = rng.choice([3, 4])
+            for _ in range(rng.randint(10, 40)):
+                events.append({"t": round(t, 4), "profile": profile})
+                t += 0.033
+        t += rng.expovariate(1 / 2.0)
+    return {"profiles": SYNTHETIC_PROFILES, "events": events}
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Sampler:
+    """Samples RSS, live threads and the Qt event queue depth on its own thread"""
+
+    def __init__(self, queue_depth, interval=SOAK_SAMPLE_INTERVAL):
+        self.queue_depth = queue_depth
+        self.interval = interval
+        self.samples = []  # (seconds, rss bytes or None, threads, queued events)
+        self.started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="soak-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def sample(self):
+        # The sampler's own thread doesn't count
+        threads = threading.active_count() - (1 if self._thread.is_alive() else 0)
+        self.samples.append((round(time.monotonic() - self.started, 3), rss_bytes(), threads, self.queue_depth()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def check_bounded(samples):
+    """Compare the last quarter of the run with the part after warm-up. Returns a list of problems."""
+    if len(samples) < 8:
+        return ["run too short to judge, give it at least a few seconds"]
+    steady = samples[int(len(samples) * SOAK_WARMUP_SHARE):]
+    early, late = steady[:len(steady) // 2], steady[-max(1, len(steady) // 4):]
+    problems = []
+
+    early_threads, late_threads = max(s[2] for s in early), max(s[2] for s in late)
+    if late_threads > early_threads + SOAK_THREAD_SLACK:
+        problems.append(f"threads grew from {early_threads} to {late_threads}")
+
+    early_queue, late_queue = max(s[3] for s in early), max(s[3] for s in late)
+    if late_queue > max(SOAK_QUEUE_SLACK, early_queue * 2):
+        problems.append(f"Qt event queue grew from {early_queue} to {late_queue} waiting events")
+
+    if all(s[1] is not None for s in steady):
+        early_rss = sorted(s[1] for s in early)[len(early) // 2]
+        late_rss = sorted(s[1] for s in late)[len(late) // 2]
+        allowed = max(SOAK_RSS_SLACK_MB * 2 ** 20, early_rss * SOAK_RSS_SLACK_SHARE)
+        if late_rss - early_rss > allowed:
+            problems.append(f"RSS grew from {early_rss / 2 ** 20:.1f} MB to {late_rss / 2 ** 20:.1f} MB")
+    return problems
+
+
+class SoakRun:
+    """One MainWindow wired to stand-in backends, and a thread that replays a trace into it"""
+
+    def __init__(self, trace, mode=SOAK_MODES["local"], speedup=10.0, repeat=1, duration=None, latency=0.02):
+        self.trace = trace
+        self.mode = mode
+        self.speedup = speedup
+        self.repeat = repeat
+        self.duration = duration
+        self.latency = latency
+        self.presses = 0
+        self.done = threading.Event()
+
+    def _profiles(self):
+        return [{**PROFILE_DEFAULTS, **cfg} for cfg in self.trace.get("profiles", [])] or [dict(PROFILE_DEFAULTS)]
+
+    def _window(self, server):
+        import spotify_vol_controller as gui
+
+        # Nothing outside the harness: no control socket, no keep-alive timer, no trace recording of our own
+        PERSISTENCE.save(SETTINGS_FILE, {"client_id": "soak-client", "client_secret": "soak-secret",
+                                         "control_endpoint": "off", "keepalive_interval": 0})
+        PERSISTENCE.flush()
+        window = gui.MainWindow()
+        auth = window.spotify_auth
+        auth.access_token, auth.refresh_token = server.access_token, "soak-refresh"
+        auth.expires_at = time.time() + BENCH_ACCESS_TOKEN_LIFETIME
+        auth.api_client.limiter = RateLimiter(rate=1e6, capacity=1e6)
+        controller = window.controller
+        controller.local_controller = LocalVolumeController(FakeSessionProvider())
+        controller.local_available = True
+        window.mode_combo.setCurrentText(self.mode)
+        return window, gui._CallableEvent.queue_depth
+
+    def _replay(self, window):
+        #Runs on its own thread, like the keyboard hook does
+        profiles = self._profiles()
+        events = self.trace.get("events", [])
+        began = time.monotonic()
+        rounds = 0
+        try:
+            while events and (self.duration is not None or rounds < self.repeat):
+                offset = events[0]["t"]
+                round_start = time.monotonic()
+                for event in events:
+                    if self.duration is not None and time.monotonic() - began >= self.duration:
+                        return
+                    delay = round_start + (event["t"] - offset) / self.speedup - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    cfg = profiles[event["profile"] % len(profiles)]
+                    if cfg.get("step"):
+                        window.apply_profile(cfg)
+                    else:
+                        window.apply_volume(int(cfg["volume"]), float(cfg["fade"]), cfg["curve"], cfg["device"])
+                    self.presses += 1
+                rounds += 1
+        finally:
+            window.controller.wait_idle(30)
+            self.done.set()
+
+    def run(self):
+        """Replay the trace. Returns (samples, problems)."""
+        from PyQt5.QtCore import QTimer
+        from PyQt5.QtWidgets import QApplication
+
+        app = QApplication.instance() or QApplication(sys.argv)
+        server = FakeSpotifyServer(self.latency).start()
+        try:
+            with bench_environment(server):
+                window, queue_depth = self._window(server)
+                sampler = Sampler(queue_depth)
+                sampler.start()
+                threading.Thread(target=self._replay, args=(window,), name="soak-replay", daemon=True).start()
+                # The GUI thread keeps draining events like it would for a user, until the replay is over
+                timer = QTimer()
+                timer.timeout.connect(lambda: self.done.is_set() and app.quit())
+                timer.start(100)
+                app.exec_()
+                timer.stop()
+                app.processEvents()
+                sampler.stop()
+                window.close()
+        finally:
+            server.stop()
+        return sampler.samples, check_bounded(sampler.samples)
+
+
+def format_samples(samples, rows=12):
+    lines = [f"{'seconds':>8} {'RSS MB':>8} {'threads':>8} {'queued':>8}"]
+    step = max(1, len(samples) // rows)
+    for seconds, rss, threads, queued in samples[::step] + samples[-1:]:
+        rss_text = f"{rss / 2 ** 20:.1f}" if rss is not None else "n/a"
+        lines.append(f"{seconds:>8} {rss_text:>8} {threads:>8} {queued:>8}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay hotkey traces against SpotiVol and check for leaks.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", metavar="FILE", help="trace recorded with \"record_trace\"")
+    source.add_argument("--synthetic", type=float, metavar="SECONDS", help="make up a trace this long")
+    parser.add_argument("--mode", choices=list(SOAK_MODES), default="local")
+    parser.add_argument("--speedup", type=float, default=10.0, help="replay this many times faster than recorded")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the trace this many times")
+    parser.add_argument("--duration", type=float, help="keep replaying for this many seconds instead of --repeat")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the fake Spotify takes to answer")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --synthetic")
+    parser.add_argument("--json", metavar="FILE", help="write every sample to FILE")
+    args = parser.parse_args(argv)
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.synthetic, args.seed)
+    run = SoakRun(trace, SOAK_MODES[args.mode], args.speedup, args.repeat, args.duration, args.latency)
+    started = time.monotonic()
+    samples, problems = run.run()
+    print(f"Replayed {run.presses} presses in {time.monotonic() - started:.1f} s ({args.mode} mode)")
+    print(format_samples(samples))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"presses": run.presses, "samples": samples, "problems": problems}, f, indent=2)
+    for problem in problems:
+        print(f"✗ {problem}")
+    if problems:
+        return 1
+    print("✓ RSS, threads and the event queue stayed bounded")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import sys
+import time
+import builtins
+import threading
+
+"""
+Startup profiling for SpotiVol. Run with --profile-startup to get a report of how long each startup phase and each
+import took, so a slow new import or a heavier window shows up before it ships.
+This module is imported first and only uses the standard library, so it doesn't slow startup down itself.
+"""
+
+# Seconds from the moment SpotiVol starts loading until the window is shown (or hotkeys are bound in headless mode)
+STARTUP_BUDGET = 1.5
+
+
+class StartupProfiler:
+    """Records startup phases and the time taken by each new top-level import"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.enabled = False
+        self.phases = []
+        self.imports = []
+        self._original_import = None
+        self._local = threading.local()
+
+    def install_if_requested(self, argv):
+        """Turn profiling on if --profile-startup is in argv (and remove it so Qt/argparse don't see it)"""
+        if "--profile-startup" not in argv:
+            return False
+        argv.remove("--profile-startup")
+        self.enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return True
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only the outermost import of a module we haven't loaded yet is timed, it includes everything it pulls in
+        depth = getattr(self._local, 'depth', 0)
+        if level or depth or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._local.depth = 1
+        began = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._local.depth = 0
+            self.imports.append((name, time.perf_counter() - began, threading.current_thread().name))
+
+    def mark(self, phase):
+        """Record that a startup phase has finished"""
+        if self.enabled:
+            self.phases.append((phase, time.perf_counter() - self.started))
+
+    def elapsed(self, phase):
+        for name, at in self.phases:
+            if name == phase:
+                return at
+        return None
+
+    def over_budget(self, phase):
+        at = self.elapsed(phase)
+        return at is not None and at > STARTUP_BUDGET
+
+    def report(self, budget_phase):
+        lines = ["SpotiVol startup profile", "", "Phases (ms since start, ms in phase):"]
+        previous = 0.0
+        for name, at in self.phases:
+            lines.append(f"  {name:<32} {at * 1000:8.1f} {(at - previous) * 1000:8.1f}")
+            previous = at
+        lines.append("")
+        lines.append("Imports (ms, slowest first):")
+        for name, took, thread in sorted(self.imports, key=lambda item: item[1], reverse=True):
+            where = "" if thread == "MainThread" else f"  [{thread}]"
+            lines.append(f"  {name:<32} {took * 1000:8.1f}{where}")
+        lines.append("")
+        at = self.elapsed(budget_phase)
+        if at is None:
+            lines.append(f"'{budget_phase}' was never reached")
+        elif at > STARTUP_BUDGET:
+            lines.append(f"✗ OVER BUDGET: '{budget_phase}' at {at * 1000:.0f} ms, budget {STARTUP_BUDGET * 1000:.0f} ms")
+        else:
+            lines.append(f"✓ '{budget_phase}' at {at * 1000:.0f} ms, budget {STARTUP_BUDGET * 1000:.0f} ms")
+        return "\n".join(lines)
+
+
+STARTUP = StartupProfiler()